@@ -0,0 +1,32 @@
+"""FSM state versions
+
+Revision ID: 5f1c3a7e9b24
+Revises: e2a9b6f1d384
+Create Date: 2026-10-18 19:42:15.604318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateSequence, DropSequence
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1c3a7e9b24'
+down_revision = 'e2a9b6f1d384'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(CreateSequence(sa.Sequence('fsm_states_version_seq')))
+    op.add_column('fsm_states', sa.Column(
+        'version',
+        sa.BigInteger(),
+        server_default=sa.text("nextval('fsm_states_version_seq')"),
+        nullable=False,
+    ))
+
+
+def downgrade():
+    op.drop_column('fsm_states', 'version')
+    op.execute(DropSequence(sa.Sequence('fsm_states_version_seq')))
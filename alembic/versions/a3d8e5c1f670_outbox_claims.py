@@ -0,0 +1,24 @@
+"""Outbox claims
+
+Revision ID: a3d8e5c1f670
+Revises: 5f1c3a7e9b24
+Create Date: 2026-10-18 20:18:37.209514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d8e5c1f670'
+down_revision = '5f1c3a7e9b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('notification_outbox', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('notification_outbox', 'claimed_at')
@@ -0,0 +1,47 @@
+"""Lookup indexes
+
+Revision ID: b7e3f90c1a52
+Revises: 9a41d2c6e8f3
+Create Date: 2026-10-18 15:47:52.410382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f90c1a52'
+down_revision = '9a41d2c6e8f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built without locking out writes to the orders table, CONCURRENTLY can not run in a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_orders_sender_id_status_id', 'orders', ['sender_id', 'status_id'],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_orders_receiver_id_status_id', 'orders', ['receiver_id', 'status_id'],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            'ix_orders_document_id_status_id', 'orders', ['document_id', 'status_id'],
+            postgresql_concurrently=True,
+        )
+    op.create_index('ix_users_active_role_id', 'users', ['role_id'], postgresql_where=sa.text('NOT is_deleted'))
+    op.create_index('ix_invitations_token', 'invitations', ['token'])
+    op.create_index('ix_cells_order_id', 'cells', ['order_id'])
+    op.create_index('ix_cells_free', 'cells', ['id'], postgresql_where=sa.text('order_id IS NULL AND is_open'))
+
+
+def downgrade():
+    op.drop_index('ix_cells_free', table_name='cells')
+    op.drop_index('ix_cells_order_id', table_name='cells')
+    op.drop_index('ix_invitations_token', table_name='invitations')
+    op.drop_index('ix_users_active_role_id', table_name='users')
+    op.drop_index('ix_orders_document_id_status_id', table_name='orders')
+    op.drop_index('ix_orders_receiver_id_status_id', table_name='orders')
+    op.drop_index('ix_orders_sender_id_status_id', table_name='orders')
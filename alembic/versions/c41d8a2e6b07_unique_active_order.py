@@ -0,0 +1,40 @@
+"""Unique active order
+
+Revision ID: c41d8a2e6b07
+Revises: b7e3f90c1a52
+Create Date: 2026-10-18 16:05:31.220914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d8a2e6b07'
+down_revision = 'b7e3f90c1a52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Duplicates are business data, they are resolved by hand before the migration is run again
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT array_agg(id ORDER BY id) FROM orders WHERE status_id NOT IN (4, 5) '
+        'GROUP BY document_id, receiver_id, sender_id HAVING count(*) > 1'
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            'Active orders are duplicated, complete or decline all but one order of each group: '
+            + '; '.join(', '.join(map(str, order_ids)) for order_ids in duplicates)
+        )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_orders_active_document_id', 'orders', ['document_id', 'receiver_id', 'sender_id'],
+            unique=True,
+            postgresql_where=sa.text('status_id NOT IN (4, 5)'),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index('ix_orders_active_document_id', table_name='orders')
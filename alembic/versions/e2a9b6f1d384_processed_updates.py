@@ -0,0 +1,30 @@
+"""Processed updates
+
+Revision ID: e2a9b6f1d384
+Revises: c41d8a2e6b07
+Create Date: 2026-10-18 16:31:08.517342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9b6f1d384'
+down_revision = 'c41d8a2e6b07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('processed_updates',
+                    sa.Column('update_id', sa.BigInteger(), autoincrement=False, nullable=False),
+                    sa.Column('received_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('update_id')
+                    )
+    op.create_index(op.f('ix_processed_updates_received_at'), 'processed_updates', ['received_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_processed_updates_received_at'), table_name='processed_updates')
+    op.drop_table('processed_updates')
@@ -0,0 +1,76 @@
+"""
+Simulated cell controller for running the bot without locker hardware
+Answers every `cell_reqeust` after a random delay, failing a given share of requests
+
+    python -m bot.cell_simulator --min-latency 0.05 --max-latency 0.5 --failure-rate 0.1
+"""
+import argparse
+import asyncio
+import random
+
+import aio_pika
+import ujson
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+from loguru import logger
+
+from utils.config import get_config
+from utils.rabbit import CELL_REQUEST_ROUTING_KEY
+
+
+class CellSimulator:
+
+    def __init__(self, channel: AbstractChannel, min_latency: float, max_latency: float, failure_rate: float):
+        self.channel = channel
+        self.min_latency = min_latency
+        self.max_latency = max_latency
+        self.failure_rate = failure_rate
+
+    async def on_request(self, message: AbstractIncomingMessage) -> None:
+        async with message.process():
+            request = ujson.loads(message.body)
+            await asyncio.sleep(random.uniform(self.min_latency, self.max_latency))
+            ok = random.random() >= self.failure_rate
+            logger.info(f'Cell {request["cell_id"]} {"opened" if ok else "jammed"}, sending={request["is_sending"]}')
+            if not message.reply_to:
+                return
+
+            reply = dict(cell_id=request['cell_id'], ok=ok)
+            if not ok:
+                reply['error'] = 'door jammed'
+            await self.channel.default_exchange.publish(
+                aio_pika.Message(body=ujson.dumps(reply).encode(), correlation_id=message.correlation_id),
+                routing_key=message.reply_to,
+            )
+
+
+async def run(min_latency: float, max_latency: float, failure_rate: float) -> None:
+    config = get_config()
+    connection = await aio_pika.connect_robust(
+        host=config.rmq.host,
+        virtualhost=config.rmq.vhost,
+        login=config.rmq.username,
+        password=config.rmq.password.get_secret_value(),
+    )
+    try:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=100)
+        queue = await channel.declare_queue(CELL_REQUEST_ROUTING_KEY, durable=True)
+        simulator = CellSimulator(channel, min_latency, max_latency, failure_rate)
+        await queue.consume(simulator.on_request)
+        logger.info('Cell simulator started')
+        await asyncio.Future()
+    finally:
+        await connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated cell controller')
+    parser.add_argument('--min-latency', type=float, default=0.05)
+    parser.add_argument('--max-latency', type=float, default=0.5)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.min_latency, args.max_latency, args.failure_rate))
+
+
+if __name__ == '__main__':
+    main()
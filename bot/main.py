@@ -1,6 +1,5 @@
 import asyncio
 
-import aio_pika
 import alembic.command
 import alembic.command
 import alembic.config
@@ -13,17 +12,31 @@ from loguru import logger
 
 from bot.sdk.filters import AuthorizedUser
 from bot.sdk.keyboards import MainMenuKeyBoard
+from bot.sdk.middlewares import FsmUpdateMiddleware, UserResolverMiddleware
+from bot.sdk.render import render_cache
+from bot.sdk.router import RoutedDispatcher
+from bot.sdk.webhook import QueuedWebhookRequestHandler, get_deduplicator, get_update_queue
+from bot.states_processors.cell import register_handlers as cell_handlers
 from bot.states_processors.document import register_handlers as view_doc_handlers
 from bot.states_processors.invitation import register_handlers as inv_reg_handlers
 from bot.states_processors.order import register_handlers as order_handlers
 from bot.states_processors.worker import register_handlers as worker_handlers
-from database.aiogram_storage import storage
-from database.models import User
+from database.aiogram_storage import PostgresStorage, storage
+from database.change_listener import ChangeListener
+from database.db_core import get_pool_stats, leak_tracker
+from database.document_catalog import document_catalog
+from database.models import User, load_lookup_tables
+from database.outbox import OutboxRelay
 from utils.config import get_config, AppConfig
+from utils.cell_client import get_cell_client
+from utils.rabbit import get_publisher
 
 bot = Bot(token=get_config().telegram.tg_token)
 
-dp = Dispatcher(bot, storage=storage)
+dp = RoutedDispatcher(bot, storage=storage)
+dp.middleware.setup(UserResolverMiddleware())
+if isinstance(storage, PostgresStorage):
+    dp.middleware.setup(FsmUpdateMiddleware(storage))
 
 
 async def unknown(message: types.Message):
@@ -57,11 +70,31 @@ async def __system_current_state(message: types.Message, state: FSMContext):
     await message.reply(f'Состояние {state if state else "отсутствует"}')
 
 
-async def register_handler():
+async def __system_pool_stats(message: types.Message):
+    await message.reply(get_pool_stats().as_text())
+
+
+async def __system_cache_stats(message: types.Message):
+    await message.reply(
+        f'{document_catalog.stats()}\n'
+        f'Страницы: hits={render_cache.hits} misses={render_cache.misses}'
+    )
+
+
+async def __system_cell_latency(message: types.Message):
+    await message.reply(get_cell_client().latency_report())
+
+
+async def __system_webhook_stats(message: types.Message):
+    await message.reply(f'{get_update_queue().stats()}\nПовторных доставок: {get_deduplicator().duplicates}')
+
+
+async def register_handler(dp: Dispatcher = dp):
     await inv_reg_handlers(dp)
     await view_doc_handlers(dp)
     await order_handlers(dp)
     await worker_handlers(dp)
+    await cell_handlers(dp)
 
     dp.message_handler(AuthorizedUser(return_user=True), state='*', commands='cancel')(cancel_handler)
     dp.message_handler(
@@ -72,6 +105,10 @@ async def register_handler():
 
     dp.message_handler(commands='__clear_key_board')(__system_clear_keyboard)
     dp.message_handler(commands='__current_state', state='*')(__system_current_state)
+    dp.message_handler(commands='__pool_stats', state='*')(__system_pool_stats)
+    dp.message_handler(commands='__cell_latency', state='*')(__system_cell_latency)
+    dp.message_handler(commands='__cache_stats', state='*')(__system_cache_stats)
+    dp.message_handler(commands='__webhook_stats', state='*')(__system_webhook_stats)
     dp.message_handler(AuthorizedUser(return_user=True))(unknown_authorized)
     dp.message_handler(state='*')(unknown_on_state)
     dp.message_handler()(unknown)
@@ -102,24 +139,28 @@ def run_alembic(cfg: AppConfig) -> None:
 async def on_startup(*_):
     settings = get_config()
     run_alembic(settings)
+    await load_lookup_tables()
     await bot.set_webhook(settings.telegram.webhook)
-    connection: aio_pika.connection.AbstractConnection = await aio_pika.connect_robust(
-        host=settings.rmq.host,
-        virtualhost=settings.rmq.vhost,
-        login=settings.rmq.username,
-        password=settings.rmq.password.get_secret_value(),
-        loop=asyncio.get_running_loop(),
-    )
-
-    channel: aio_pika.channel.AbstractChannel = await connection.channel()
-    # await storage.set_data(user='storage', chat='connection', data=dict(channel=channel))
-    storage.data['rmq_channel'] = dict(channel=channel)
+    if leak_tracker is not None:
+        asyncio.create_task(leak_tracker.run(settings.db.leak_check_interval))
+    if settings.db.notify_changes:
+        asyncio.create_task(ChangeListener(settings.db).run())
+    await get_publisher().connect()
+    await get_cell_client().start()
+    asyncio.create_task(OutboxRelay(get_publisher(), settings.outbox).run())
+    get_update_queue().start(dp)
+    if settings.webhook.dedup_shared:
+        asyncio.create_task(get_deduplicator().run_pruning())
 
 
 async def on_shutdown(dispatcher: Dispatcher):
     logger.warning('Shutting down..')
+    await get_update_queue().stop()
+    logger.info(f'DB pool stats:\n{get_pool_stats().as_text()}')
     await dispatcher.storage.close()
     await dispatcher.storage.wait_closed()
+    await get_cell_client().stop()
+    await get_publisher().close()
 
 
 def main():
@@ -127,12 +168,12 @@ def main():
     asyncio.set_event_loop(loop)
     loop.run_until_complete(register_handler())
     config = get_config()
-    executor.start_webhook(
-        dispatcher=dp,
+    runner = executor.Executor(dp, skip_updates=True)
+    runner.on_startup(on_startup)
+    runner.on_shutdown(on_shutdown)
+    runner.start_webhook(
         webhook_path='',
-        on_startup=on_startup,
-        on_shutdown=on_shutdown,
-        skip_updates=True,
+        request_handler=QueuedWebhookRequestHandler,
         host=config.telegram.host,
         port=config.telegram.port,
     )
@@ -0,0 +1,272 @@
+import asyncio
+import dataclasses
+import enum
+import time
+from typing import Awaitable, Callable
+
+import aio_pika
+import ujson
+from aio_pika.abc import AbstractIncomingMessage
+from aiogram import Bot
+from aiogram.utils.exceptions import (
+    ChatNotFound, NetworkError, RestartingTelegram, RetryAfter, TelegramAPIError, Unauthorized,
+)
+from loguru import logger
+
+from utils.config import get_config, NotifierConfig
+from utils.functions import TELEGRAM_MESSAGE_LIMIT, split_text
+from utils.rabbit import PUSH_ROUTING_KEY
+from utils.rate_limit import TokenBucket
+
+
+class Delivery(enum.Enum):
+    # Sent, or dropped because the user can not receive messages
+    DONE = 'done'
+    # Failed for now, delivered again later
+    RETRY = 'retry'
+    # Refused by Telegram, sending it again would fail the same way
+    REJECTED = 'rejected'
+
+
+SendFunc = Callable[[int, str], Awaitable]
+AckFunc = Callable[[Delivery], Awaitable[None]]
+
+# The user blocked the bot, deleted the account or never started a chat
+_UNDELIVERABLE = (Unauthorized, ChatNotFound)
+# Server errors are raised as TelegramAPIError itself, see aiogram.bot.api.check_result
+_RETRYABLE = (RetryAfter, NetworkError, RestartingTelegram, asyncio.TimeoutError)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Errors which are not Telegram's answer, like a bug in the sending code, are retried too"""
+    if isinstance(error, _RETRYABLE):
+        return True
+    return not isinstance(error, TelegramAPIError) or type(error) is TelegramAPIError
+
+
+@dataclasses.dataclass
+class _Batch:
+    ready_at: float
+    messages: list[str] = dataclasses.field(default_factory=list)
+    acks: list[AckFunc] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class _Chunk:
+    """One Telegram message, it completes `messages` and carries their acks"""
+    text: str
+    messages: list[str] = dataclasses.field(default_factory=list)
+    acks: list[AckFunc] = dataclasses.field(default_factory=list)
+
+
+class NotificationService:
+    """
+    Delivers `push` notifications to Telegram
+    Messages for one user arriving within `coalesce_window` are sent as one message,
+    a user with `early_flush_size` waiting messages is sent to without waiting for the window.
+    Sending respects the global and the per-chat Telegram rate limits.
+    Every fed message is acked with DONE once delivered (or undeliverable), with RETRY if delivery
+    failed and should be retried and with REJECTED if Telegram refused it.
+    A refused coalesced message is sent again message by message, so only the refused one is rejected.
+    """
+
+    def __init__(self, send: SendFunc, config: NotifierConfig):
+        self.send = send
+        self.config = config
+
+        self._pending: dict[int, _Batch] = {}
+        self._queued: set[int] = set()
+        self._sending: set[int] = set()
+        self._ready: asyncio.Queue[int] = asyncio.Queue()
+        self._global_bucket = TokenBucket(config.global_rate)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.config.workers)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def feed(self, telegram_user_id: int, message: str, ack: AckFunc) -> None:
+        batch = self._pending.get(telegram_user_id)
+        if batch is None:
+            batch = self._pending[telegram_user_id] = _Batch(ready_at=time.monotonic() + self.config.coalesce_window)
+            asyncio.get_running_loop().call_later(self.config.coalesce_window, self._schedule, telegram_user_id)
+        batch.messages.append(message)
+        batch.acks.append(ack)
+        if len(batch.messages) >= self.config.early_flush_size:
+            batch.ready_at = time.monotonic()
+            self._schedule(telegram_user_id)
+
+    async def on_rmq_message(self, message: AbstractIncomingMessage) -> None:
+        try:
+            body = ujson.loads(message.body)
+            telegram_user_id, text = int(body['telegram_user_id']), body['message']
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f'Malformed push message dropped: {message.body!r}')
+            await message.reject()
+            return
+
+        async def ack(delivery: Delivery) -> None:
+            if delivery is Delivery.DONE:
+                await message.ack()
+            elif delivery is Delivery.RETRY:
+                await message.nack(requeue=True)
+            else:
+                # Dead-lettered if the queue has a dead letter policy, dropped otherwise
+                logger.error(f'Push message rejected: {message.body!r}')
+                await message.reject()
+
+        self.feed(telegram_user_id, text, ack)
+
+    def _schedule(self, telegram_user_id: int) -> None:
+        batch = self._pending.get(telegram_user_id)
+        if batch is None or batch.ready_at > time.monotonic():
+            return
+        if telegram_user_id in self._sending or telegram_user_id in self._queued:
+            return
+        self._queued.add(telegram_user_id)
+        self._ready.put_nowait(telegram_user_id)
+
+    def _chat_bucket(self, telegram_user_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(telegram_user_id)
+        if bucket is None:
+            bucket = self._chat_buckets[telegram_user_id] = TokenBucket(self.config.chat_rate, capacity=1)
+        return bucket
+
+    @staticmethod
+    def _chunks(messages: list[str], acks: list[AckFunc], coalesce: bool = True) -> list[_Chunk]:
+        """
+        Joins the messages into as few Telegram messages as fit, a message is split only if it is too long itself
+        Every chunk carries the acks of the messages it completes
+        :param coalesce: False to give every message chunks of its own
+        """
+        chunks: list[_Chunk] = []
+        chunk = _Chunk('')
+        for message, ack in zip(messages, acks):
+            joined = f'{chunk.text}\n\n{message}' if chunk.text else message
+            if coalesce and len(joined) <= TELEGRAM_MESSAGE_LIMIT:
+                chunk.text = joined
+                chunk.messages.append(message)
+                chunk.acks.append(ack)
+                continue
+            if chunk.text or chunk.acks:
+                chunks.append(chunk)
+            parts = split_text(message) or [message]
+            chunks.extend(_Chunk(part) for part in parts[:-1])
+            chunk = _Chunk(parts[-1], [message], [ack])
+        if chunk.text or chunk.acks:
+            chunks.append(chunk)
+        return chunks
+
+    @staticmethod
+    async def _ack(ack: AckFunc, delivery: Delivery) -> None:
+        try:
+            await ack(delivery)
+        except Exception as e:
+            logger.exception(f'Push message acknowledgement failed: {e}')
+
+    async def _worker(self) -> None:
+        while True:
+            telegram_user_id = await self._ready.get()
+            self._queued.discard(telegram_user_id)
+            batch = self._pending.pop(telegram_user_id, None)
+            if batch is None:
+                continue
+
+            self._sending.add(telegram_user_id)
+            try:
+                settled = await self._send_chunks(telegram_user_id, self._chunks(batch.messages, batch.acks))
+            finally:
+                self._sending.discard(telegram_user_id)
+
+            for ack, delivery in settled:
+                await self._ack(ack, delivery)
+
+            if telegram_user_id in self._pending:
+                self._schedule(telegram_user_id)
+            elif self._chat_bucket(telegram_user_id).is_full:
+                del self._chat_buckets[telegram_user_id]
+
+    async def _send_chunks(self, telegram_user_id: int, chunks: list[_Chunk]) -> list[tuple[AckFunc, Delivery]]:
+        """
+        Sends the chunks in order until one fails to be sent for now,
+        messages of the chunks already sent are acked and only the rest are delivered again
+        """
+        settled = []
+        for index, chunk in enumerate(chunks):
+            try:
+                await self._deliver(telegram_user_id, chunk.text)
+            except _UNDELIVERABLE as e:
+                logger.info(f'Push to {telegram_user_id} dropped: {e}')
+                return settled + [(ack, Delivery.DONE) for rest in chunks[index:] for ack in rest.acks]
+            except Exception as e:
+                if _is_retryable(e):
+                    logger.exception(f'Push delivery to {telegram_user_id} failed: {e}')
+                    return settled + [(ack, Delivery.RETRY) for rest in chunks[index:] for ack in rest.acks]
+                if len(chunk.messages) > 1:
+                    logger.warning(f'Coalesced push to {telegram_user_id} refused, sending one by one: {e}')
+                    settled += await self._send_chunks(
+                        telegram_user_id,
+                        self._chunks(chunk.messages, chunk.acks, coalesce=False),
+                    )
+                    continue
+                logger.warning(f'Push to {telegram_user_id} refused: {e}')
+                settled += [(ack, Delivery.REJECTED) for ack in chunk.acks]
+                continue
+            settled += [(ack, Delivery.DONE) for ack in chunk.acks]
+        return settled
+
+    async def _deliver(self, telegram_user_id: int, text: str) -> None:
+        """
+        Waits out flood control up to `send_attempts` times
+        :raise: RetryAfter if the message was not sent in `send_attempts`, or the error of the send
+        """
+        for attempt in range(1, self.config.send_attempts + 1):
+            await self._chat_bucket(telegram_user_id).acquire()
+            await self._global_bucket.acquire()
+            try:
+                await self.send(telegram_user_id, text)
+                return
+            except RetryAfter as e:
+                if attempt == self.config.send_attempts:
+                    raise
+                logger.warning(f'Flood control, retry in {e.timeout}s')
+                await asyncio.sleep(e.timeout)
+
+
+async def run() -> None:
+    config = get_config()
+    bot = Bot(token=config.telegram.tg_token)
+    service = NotificationService(send=bot.send_message, config=config.notifier)
+
+    connection = await aio_pika.connect_robust(
+        host=config.rmq.host,
+        virtualhost=config.rmq.vhost,
+        login=config.rmq.username,
+        password=config.rmq.password.get_secret_value(),
+    )
+    try:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=config.notifier.prefetch)
+        queue = await channel.declare_queue(PUSH_ROUTING_KEY, durable=True)
+
+        service.start()
+        await queue.consume(service.on_rmq_message)
+        logger.info('Notification service started')
+        await asyncio.Future()
+    finally:
+        await service.stop()
+        await connection.close()
+        await (await bot.get_session()).close()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Compares finding the handler of a message through the linear filter chain and through the router
+
+    python -m bot.router_benchmark --rounds 2000
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.filters.filters import FilterNotPassed, check_filters
+from aiogram.dispatcher.handler import ctx_data
+
+from bot.main import register_handler
+from bot.sdk.keyboards import MainMenuKeyBoard, OrderViewToKeyBoard, WorkerManageActionKeyBoard
+from bot.sdk.middlewares import CURRENT_USER_KEY
+from bot.sdk.router import MessageRouter, RoutedDispatcher
+from bot.states import OrderView, WorkerManage, WorkerManageAddInvite
+from database.models import User, UserRole
+from utils.config import get_config
+
+CHAT_ID = 1
+
+SAMPLES: list[tuple[str, str | None]] = [
+    (MainMenuKeyBoard.Button.doc_list.value, None),
+    (MainMenuKeyBoard.Button.orders.value, None),
+    (OrderViewToKeyBoard.Button.to_me.value, OrderView.to.state),
+    (WorkerManageActionKeyBoard.Button.view_worker.value, WorkerManage.action.state),
+    ('Иванов Иван Иванович', WorkerManageAddInvite.username.state),
+    ('/order_42', None),
+    ('/document_7', None),
+    ('/cancel', OrderView.to.state),
+    ('Отмена', WorkerManage.action.state),
+    ('какой-то текст', None),
+]
+
+
+def _message(text: str) -> types.Message:
+    return types.Message(**{
+        'message_id': 1,
+        'date': 0,
+        'text': text,
+        'chat': dict(id=CHAT_ID, type='private'),
+        'from': dict(id=CHAT_ID, is_bot=False, first_name='bench'),
+    })
+
+
+async def _first_match(dispatcher: Dispatcher, message: types.Message, user: User):
+    """Returns the handler which would accept the message and the number of handlers checked"""
+    types.Chat.set_current(message.chat)
+    types.User.set_current(message.from_user)
+    ctx_data.set({CURRENT_USER_KEY: user})
+    handlers = dispatcher.message_handlers
+    if isinstance(handlers, MessageRouter):
+        candidates = [(route.handler_obj, route.filters) for route in await handlers.routes(message)]
+    else:
+        candidates = [(handler_obj, handler_obj.filters) for handler_obj in handlers.handlers]
+
+    for checked, (handler_obj, filters) in enumerate(candidates, start=1):
+        try:
+            await check_filters(filters, (message,))
+        except FilterNotPassed:
+            continue
+        return handler_obj.handler, checked
+    return None, len(candidates)
+
+
+async def _measure(dispatcher: Dispatcher, message: types.Message, user: User, rounds: int):
+    Dispatcher.set_current(dispatcher)
+    # Every round runs in a task of its own, so the per-update state cache starts empty
+    handler, checked = await asyncio.create_task(_first_match(dispatcher, message, user))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.create_task(_first_match(dispatcher, message, user))
+    return handler, checked, (time.perf_counter() - started) / rounds * 1e6
+
+
+async def _dispatcher(bot: Bot, routed: bool) -> Dispatcher:
+    dispatcher_class = RoutedDispatcher if routed else Dispatcher
+    dispatcher = dispatcher_class(bot, storage=MemoryStorage())
+    await register_handler(dispatcher)
+    return dispatcher
+
+
+async def run(rounds: int) -> None:
+    bot = Bot(token=get_config().telegram.tg_token)
+    Bot.set_current(bot)
+    user = User(id=1, telegram_id=CHAT_ID, username='bench', role_id=UserRole.ACCOUNTANT, is_deleted=False)
+    linear = await _dispatcher(bot, routed=False)
+    routed = await _dispatcher(bot, routed=True)
+
+    print(f'{"message":<40} {"state":<32} {"linear, us":>11} {"routed, us":>11} {"checked":>9}')
+    totals = [0.0, 0.0]
+    for text, state in SAMPLES:
+        message = _message(text)
+        for dispatcher in (linear, routed):
+            await dispatcher.storage.set_state(chat=CHAT_ID, user=CHAT_ID, state=state)
+
+        linear_handler, linear_checked, linear_cost = await _measure(linear, message, user, rounds)
+        routed_handler, routed_checked, routed_cost = await _measure(routed, message, user, rounds)
+        assert linear_handler is routed_handler, f'{text!r} is routed to {routed_handler} instead of {linear_handler}'
+
+        totals[0] += linear_cost
+        totals[1] += routed_cost
+        print(
+            f'{text[:40]:<40} {str(state)[:32]:<32} {linear_cost:>11.1f} {routed_cost:>11.1f} '
+            f'{linear_checked:>4} {routed_checked:>4}'
+        )
+    print(f'{"mean per update":<73} {totals[0] / len(SAMPLES):>11.1f} {totals[1] / len(SAMPLES):>11.1f}')
+    await (await bot.get_session()).close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Message routing microbenchmark')
+    parser.add_argument('--rounds', type=int, default=2000)
+    asyncio.run(run(parser.parse_args().rounds))
+
+
+if __name__ == '__main__':
+    main()
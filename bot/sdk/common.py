@@ -1,55 +1,274 @@
+import dataclasses
+from typing import Awaitable, Callable, Type
+
 from aiogram import types
+from aiogram.utils.callback_data import CallbackData
+from aiogram.utils.exceptions import MessageNotModified
+from loguru import logger
+
+from bot.sdk.keyboards import MainMenuKeyBoard, CompiledKeyboard
+from bot.sdk.render import ListTemplate, render_cache
+from database.controller import DbController, Page
+from database.db_core import outside_unit_of_work
+from database.models import Order, Document, OrderStatus, UserRole, User, Invitation, Cell
+from utils.cell_client import CellOpenResult, get_cell_client
+from utils.config import get_config
+
+PAGE_SIZE = 20
+
+page_callback = CallbackData('page', 'view', 'filter', 'direction', 'key')
+
+# Order listing filter is two letters: statuses (`a`ctive/`d`one) and direction (`r`eceived/`s`ent)
+ORDER_VIEW_STATUSES = {
+    'a': (OrderStatus.NEW, OrderStatus.PROCESSING, OrderStatus.READY),
+    'd': (OrderStatus.DONE, OrderStatus.DECLINED),
+}
+
 
-from bot.sdk.keyboards import MainMenuKeyBoard
-from database.models import Order, Document, OrderStatus, UserRole, User
+ORDER_LIST: ListTemplate[Order] = ListTemplate(
+    header='Список заявок:\n',
+    row=lambda order: f'№{order.id}. [{OrderStatus.get_str_by_id(order.status_id)}] {order.document.name}\n',
+)
+ORDER_LIST_WITH_LINKS: ListTemplate[Order] = ListTemplate(
+    header=ORDER_LIST.header,
+    row=lambda order: f'{ORDER_LIST.row(order)}/order_{order.id}\n\n',
+)
+DOCUMENT_LIST: ListTemplate[Document] = ListTemplate(
+    header='Список документов:\n',
+    row=lambda document: f'№{document.id}. {document.name}\n/document_{document.id}\n\n',
+)
+WORKER_LIST: ListTemplate[User] = ListTemplate(
+    header='Работники: \n',
+    row=lambda worker: f'{worker.id}. {worker.username}\n/worker_{worker.id}\n\n',
+)
+INVITATION_LIST: ListTemplate[Invitation] = ListTemplate(
+    header='Приглашения: \n',
+    row=lambda invite: f'{invite.id}. {invite.username} -- {UserRole.get_str_by_id(invite.role_id)}\n\n',
+)
+
+
+def order_list_template(user: User) -> ListTemplate[Order]:
+    return ORDER_LIST_WITH_LINKS if user.role_id == UserRole.ACCOUNTANT else ORDER_LIST
 
 
 async def get_order_view(orders: list[Order], user: User) -> str:
-    text = 'Список заявок:\n'
-    for order in orders:
-        document = await Document.get(id=order.document_id)
-        text += f'№{order.id}. [{OrderStatus.get_str_by_id(order.status_id)}] {document.name}\n'
+    """Orders must be fetched with `with_related=True`"""
+    return order_list_template(user).render(orders)
+
+
+async def _render_page(
+        cache_key: tuple,
+        models: tuple[Type[DbController], ...],
+        fetch: Callable[[], Awaitable[Page]],
+        render: Callable[[list], str],
+) -> tuple[str, Page]:
+    key = render_cache.key(models, *cache_key)
+    rendered = render_cache.get(key)
+    if rendered is None:
+        page = await fetch()
+        # Rows are not needed once rendered
+        rendered = render(page.items), dataclasses.replace(page, items=[])
+        render_cache.set(key, rendered)
+    return rendered
+
+
+async def documents_page(user: User | None, filter_: str, **keys) -> tuple[str, Page]:
+    return await _render_page(
+        ('doc', *keys.items()),
+        (Document,),
+        lambda: Document.get_page(limit=PAGE_SIZE, is_deleted=False, **keys),
+        DOCUMENT_LIST.render,
+    )
+
+
+async def workers_page(user: User, filter_: str, **keys) -> tuple[str, Page]:
+    return await _render_page(
+        ('wrk', *keys.items()),
+        (User,),
+        lambda: User.get_page(limit=PAGE_SIZE, role_id=UserRole.WORKER, is_deleted=False, **keys),
+        WORKER_LIST.render,
+    )
+
+
+async def invitations_page(user: User, filter_: str, **keys) -> tuple[str, Page]:
+    return await _render_page(
+        ('inv', *keys.items()),
+        (Invitation,),
+        lambda: Invitation.get_page(limit=PAGE_SIZE, **keys),
+        INVITATION_LIST.render,
+    )
+
+
+async def orders_page(user: User, filter_: str, **keys) -> tuple[str, Page]:
+    statuses, direction = filter_
+    return await _render_page(
+        ('ord', filter_, user.id, user.role_id, *keys.items()),
+        (Order, Document),
+        lambda: Order.get_page_for_view(
+            limit=PAGE_SIZE,
+            statuses=ORDER_VIEW_STATUSES[statuses],
+            receiver_id=user.id if direction == 'r' else None,
+            sender_id=user.id if direction == 's' else None,
+            with_related=True,
+            **keys,
+        ),
+        order_list_template(user).render,
+    )
+
+
+PAGE_VIEWS: dict[str, Callable[..., Awaitable[tuple[str, Page]]]] = {
+    'doc': documents_page,
+    'wrk': workers_page,
+    'inv': invitations_page,
+    'ord': orders_page,
+}
 
-        if user.role_id == UserRole.ACCOUNTANT:
-            text += f'/order_{order.id}\n\n'
-    return text
+# Filters every view is listed with, callback data comes from the client and may carry anything else
+PAGE_FILTERS: dict[str, frozenset[str]] = {
+    'doc': frozenset({''}),
+    'wrk': frozenset({''}),
+    'inv': frozenset({''}),
+    'ord': frozenset(statuses + direction for statuses in ORDER_VIEW_STATUSES for direction in 'rs'),
+}
+PAGE_DIRECTIONS = {'next': 'after', 'prev': 'before'}
+# Keys are ids of integer columns
+MAX_PAGE_KEY = 2 ** 31 - 1
+
+
+def get_page_markup(page: Page, view: str, filter_: str = '') -> types.InlineKeyboardMarkup | None:
+    buttons = []
+    if page.prev_key is not None:
+        buttons.append(types.InlineKeyboardButton(
+            '⬅️Назад',
+            callback_data=page_callback.new(view=view, filter=filter_, direction='prev', key=page.prev_key),
+        ))
+    if page.next_key is not None:
+        buttons.append(types.InlineKeyboardButton(
+            'Далее➡️',
+            callback_data=page_callback.new(view=view, filter=filter_, direction='next', key=page.next_key),
+        ))
+    if not buttons:
+        return None
+    return types.InlineKeyboardMarkup().row(*buttons)
+
+
+async def send_page(
+        message: types.Message,
+        user: User | None,
+        view: str,
+        filter_: str = '',
+        reply_markup: CompiledKeyboard | None = None,
+):
+    """
+    Sends the first page of a listing
+    A message has room for one keyboard only, so when the listing has more pages
+    the reply keyboard goes with a separate short message
+    """
+    text, page = await PAGE_VIEWS[view](user, filter_)
+    page_markup = get_page_markup(page, view, filter_)
+    if page_markup is None:
+        await message.answer(text, reply_markup=reply_markup)
+        return
+
+    await message.answer(text, reply_markup=page_markup)
+    if reply_markup is not None:
+        await message.answer('Листайте список кнопками под ним', reply_markup=reply_markup)
+
+
+def parse_page_turn(callback_data: dict) -> tuple[str, str, dict[str, int]] | None:
+    """
+    :return: view, filter and the keyset bound of the requested page, None if the callback data is not valid
+    """
+    view, filter_, key = callback_data['view'], callback_data['filter'], callback_data['key']
+    bound = PAGE_DIRECTIONS.get(callback_data['direction'])
+    if filter_ not in PAGE_FILTERS.get(view, ()) or bound is None:
+        return None
+    if not (key.isascii() and key.isdigit()) or int(key) > MAX_PAGE_KEY:
+        return None
+    return view, filter_, {bound: int(key)}
+
+
+async def turn_page(query: types.CallbackQuery, callback_data: dict, user: User):
+    page_turn = parse_page_turn(callback_data)
+    if page_turn is None:
+        logger.warning(f'Invalid page callback from {query.from_user.id}: {query.data!r}')
+        await query.answer("Список устарел, откройте его заново")
+        return
+    view, filter_, keys = page_turn
+
+    text, page = await PAGE_VIEWS[view](user, filter_, **keys)
+    try:
+        await query.message.edit_text(text, reply_markup=get_page_markup(page, view, filter_))
+    except MessageNotModified:
+        pass
+    await query.answer()
 
 
 async def list_documents(message: types.Message):
-    documents = await Document.get_list(is_deleted=False)
-    text = "Список документов:\n"
-    for document in documents:
-        text += f"№{document.id}. {document.name}\n/document_{document.id}\n\n"
-    await message.answer(text)
+    await send_page(message, None, 'doc')
 
 
 async def list_workers(message: types.Message, user: User):
-    users: list[User] = await User.get_list(role_id=UserRole.WORKER, is_deleted=False)
-
-    text = 'Работники: \n'
-    for worker in users:
-        text += f'{worker.id}. {worker.username}\n/worker_{worker.id}\n\n'
-    await message.answer(
-        text,
+    await send_page(
+        message,
+        user,
+        'wrk',
         reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
     )
 
 
-async def create_order_by_accountant(message: types.Message, user: User, document: Document, worker: User):
-    order = await Order.get_not_completed_order(document_id=document.id, sender_id=worker.id)
-    if order:
+async def create_order_by_accountant(message: types.Message, user: User, document_id: int, worker_id: int):
+    order, created = await Order.create_or_get_active(
+        sender_id=worker_id,
+        document_id=document_id,
+        receiver_id=user.id,
+    )
+    if not created:
         await message.answer(
             f"У вас уже есть сформированная заявка №{order.id} на данный документ",
             reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
         )
         return
 
-    order = await Order.create_with_push(
-        sender_id=worker.id,
-        document_id=document.id,
-        receiver_id=user.id,
-    )
     await message.answer(
         f"Заявка №{order.id} успешно сформирована",
         reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
     )
+
+
+async def open_free_cell(order_id: int) -> tuple[Cell | None, CellOpenResult | None]:
+    """
+    Claims a free cell for the order and waits until the controller opens it
+    The claim is committed before the controller is asked and released by another commit,
+    so the cell is never open without an order recorded in it
+    A cell the controller failed to open is taken out of service and the next free one is tried,
+    a cell left unanswered goes back to the free ones
+    :return: opened cell or None, and the outcome of the last open request, None if there was no free cell
+    """
+    result = None
+    async with outside_unit_of_work():
+        for _ in range(get_config().cell_controller.failover_cells + 1):
+            cell: Cell | None = await Cell.claim_free(order_id=order_id)
+            if cell is None:
+                break
+            try:
+                result = await get_cell_client().open_cell(cell.id, is_sending=True)
+            except Exception:
+                # The request may not have reached the controller
+                await _release_cell(cell, is_open=True)
+                raise
+            if result is CellOpenResult.OPENED:
+                return cell, result
+            if result is CellOpenResult.NO_REPLY:
+                # Other cells are not tried either, the controller is likely unreachable
+                await _release_cell(cell, is_open=True)
+                break
+
+            logger.warning(f'Cell {cell.id} is taken out of service')
+            await _release_cell(cell, is_open=False)
+    return None, result
+
+
+async def _release_cell(cell: Cell, is_open: bool) -> None:
+    if await cell.update(order_id=None, is_open=is_open) is None:
+        logger.error(f'Cell {cell.id} stays claimed by order {cell.order_id}')
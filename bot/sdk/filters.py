@@ -1,7 +1,8 @@
 from aiogram import types
 from aiogram.dispatcher.filters import Filter
+from aiogram.dispatcher.handler import ctx_data
 
-from database.models import User
+from bot.sdk.middlewares import resolve_user
 
 
 class AuthorizedUser(Filter):
@@ -12,7 +13,7 @@ class AuthorizedUser(Filter):
         self.return_user = return_user
 
     async def check(self, obj: types.Message | types.CallbackQuery | types.InlineQuery | types.Poll):
-        user = await User.get_by_telegram_id(obj.from_user.id)
+        user = await resolve_user(obj.from_user.id, ctx_data.get())
         if not user:
             return False
         if self.user_role is not None and user.role_id != self.user_role:
@@ -1,9 +1,11 @@
 import abc
 import enum
+from typing import Any
 
 from aiogram import types
+from aiogram.utils import json
 
-from database.models import User, UserRole
+from database.models import OrderStatus, User, UserRole
 from utils.functions import get_all_enum_values
 
 
@@ -11,31 +13,66 @@ class ExtraButtons(str, enum.Enum):
     cancel = 'Отмена'
 
 
+class CompiledKeyboard(str):
+    """
+    Reply keyboard serialized once into the JSON Telegram expects
+    aiogram passes strings to the API as is, so a reply skips building and dumping the markup
+    """
+    __slots__ = ()
+
+    @classmethod
+    def compile(cls, keys: list[str]) -> 'CompiledKeyboard':
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, selective=True)
+        markup.add(*keys)
+        return cls(json.dumps(markup.to_python()))
+
+
 class AbstractKeyBoard(metaclass=abc.ABCMeta):
+    """
+    Keyboards are compiled for every role and every kwargs of `variants` when the class is defined,
+    `get_reply_markup` only looks them up
+    """
 
     class Button(str, enum.Enum):
         pass
 
     extra_buttons: set[enum.Enum] = {ExtraButtons.cancel}
     accountant_buttons: set[enum.Enum] = set()
+    variants: tuple[dict[str, Any], ...] = ({},)
+
+    _compiled: dict[tuple[int, tuple], CompiledKeyboard]
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._compiled = {}
+        for role_id in (UserRole.ACCOUNTANT, UserRole.WORKER):
+            for variant in cls.variants:
+                cls._compile(role_id, variant)
+
+    @classmethod
+    def _compile(cls, role_id: int, kwargs: dict[str, Any]) -> CompiledKeyboard:
+        compiled = CompiledKeyboard.compile(cls._get_keys(role_id, **kwargs))
+        cls._compiled[(role_id, tuple(sorted(kwargs.items())))] = compiled
+        return compiled
 
     @classmethod
     def get_values(cls) -> list[str]:
         return get_all_enum_values(cls.Button)
 
     @classmethod
-    async def _get_keys(cls, user: User, *args, **kwargs) -> list[str]:
+    def _get_keys(cls, role_id: int, **kwargs) -> list[str]:
         exclude_set = None
         extra_set = {c.value for c in cls.extra_buttons}
-        if user.role_id != UserRole.ACCOUNTANT:
+        if role_id != UserRole.ACCOUNTANT:
             exclude_set = {c.value for c in cls.accountant_buttons}
         return get_all_enum_values(cls.Button, except_values=exclude_set, extra_values=extra_set)
 
     @classmethod
-    async def get_reply_markup(cls, user: User, *args, **kwargs) -> types.ReplyKeyboardMarkup:
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, selective=True)
-        markup.add(*(await cls._get_keys(user, *args, **kwargs)))
-        return markup
+    async def get_reply_markup(cls, user: User, **kwargs) -> CompiledKeyboard:
+        compiled = cls._compiled.get((user.role_id, tuple(sorted(kwargs.items()))))
+        if compiled is None:
+            compiled = cls._compile(user.role_id, kwargs)
+        return compiled
 
 
 class MainMenuKeyBoard(AbstractKeyBoard):
@@ -88,8 +125,8 @@ class WorkerManageActionKeyBoard(AbstractKeyBoard):
 class WorkerManageAddInvitationRoleKeyBoard(AbstractKeyBoard):
 
     class Button(str, enum.Enum):
-        accountant = "🧑‍💻Бухгалтер"
-        worker = "👷‍Сотрудник"
+        accountant = UserRole.get_str_by_id(UserRole.ACCOUNTANT)
+        worker = UserRole.get_str_by_id(UserRole.WORKER)
 
 
 class OrderActionKeyBoard(AbstractKeyBoard):
@@ -119,12 +156,14 @@ class OrderDetailedViewKeyBoard(AbstractKeyBoard):
         change_status = "Сменить статус"
         open_cell = "Открыть ячейку"
 
+    variants: tuple[dict[str, Any], ...] = ({'with_open_cell': False}, {'with_open_cell': True})
+
     @classmethod
-    async def _get_keys(cls, user: User, *args, **kwargs) -> list[str]:
+    def _get_keys(cls, role_id: int, **kwargs) -> list[str]:
         resp: list[str] = [button.value for button in cls.extra_buttons]
         if kwargs.get('with_open_cell', False):
             resp.append(cls.Button.open_cell.value)
-        if user.role_id == UserRole.ACCOUNTANT:
+        if role_id == UserRole.ACCOUNTANT:
             resp.append(cls.Button.change_status.value)
         return resp
 
@@ -132,8 +171,20 @@ class OrderDetailedViewKeyBoard(AbstractKeyBoard):
 class OrderChangeStatusKeyBoard(AbstractKeyBoard):
 
     class Button(str, enum.Enum):
-        new = 'Новая'
-        processing = 'Обрабатывается'
-        ready = 'Готова к выдачи'
-        done = 'Выполнена'
-        declined = 'Отменена'
+        new = OrderStatus.get_str_by_id(OrderStatus.NEW)
+        processing = OrderStatus.get_str_by_id(OrderStatus.PROCESSING)
+        ready = OrderStatus.get_str_by_id(OrderStatus.READY)
+        done = OrderStatus.get_str_by_id(OrderStatus.DONE)
+        declined = OrderStatus.get_str_by_id(OrderStatus.DECLINED)
+
+    variants: tuple[dict[str, Any], ...] = tuple({'current': status_id} for status_id in OrderStatus.transitions)
+
+    @classmethod
+    def _get_keys(cls, role_id: int, **kwargs) -> list[str]:
+        """
+        :param current: status of the order, only statuses it may be moved to are shown
+        """
+        allowed = OrderStatus.transitions.get(kwargs.get('current'), OrderStatus.names.by_id.keys())
+        resp: list[str] = [button.value for button in cls.Button if OrderStatus.get_id_by_str(button.value) in allowed]
+        resp.extend(button.value for button in cls.extra_buttons)
+        return resp
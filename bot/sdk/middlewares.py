@@ -0,0 +1,41 @@
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from database.aiogram_storage import PostgresStorage
+from database.models import User
+
+CURRENT_USER_KEY = 'current_user'
+FSM_UPDATE_KEY = 'fsm_update'
+
+
+async def resolve_user(telegram_user_id: int, data: dict) -> User | None:
+    """Load the sender once per update and keep it in the handler data"""
+    if CURRENT_USER_KEY not in data:
+        data[CURRENT_USER_KEY] = await User.get_by_telegram_id(telegram_user_id)
+    return data[CURRENT_USER_KEY]
+
+
+class UserResolverMiddleware(BaseMiddleware):
+    """Resolves the sender before filters run so every AuthorizedUser shares one query"""
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        await resolve_user(message.from_user.id, data)
+
+    async def on_pre_process_callback_query(self, query: types.CallbackQuery, data: dict):
+        await resolve_user(query.from_user.id, data)
+
+
+class FsmUpdateMiddleware(BaseMiddleware):
+    """Writes the FSM changes made while processing an update once, after the handlers"""
+
+    def __init__(self, storage: PostgresStorage):
+        super().__init__()
+        self.storage = storage
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        data[FSM_UPDATE_KEY] = self.storage.begin_update()
+
+    async def on_post_process_update(self, update: types.Update, results: list, data: dict):
+        token = data.get(FSM_UPDATE_KEY)
+        if token is not None:
+            await self.storage.end_update(token)
@@ -0,0 +1,60 @@
+import dataclasses
+from typing import Callable, Generic, Hashable, Iterable, Type, TypeVar
+
+from aiogram import types
+
+from database.controller import DbController
+from utils.cache import TTLCache
+from utils.config import get_config
+
+_T = TypeVar('_T')
+
+
+@dataclasses.dataclass(frozen=True)
+class ListTemplate(Generic[_T]):
+    """
+    Text view of a list: a static header and a row function,
+    rows are assembled with a single join instead of repeated concatenation
+    """
+    header: str
+    row: Callable[[_T], str]
+
+    def render(self, rows: Iterable[_T]) -> str:
+        return self.header + ''.join(map(self.row, rows))
+
+
+class RenderCache:
+    """
+    Rendered views keyed by their arguments and the data versions of the tables they show,
+    so a view is rendered again only after one of those tables changed
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self._cache: TTLCache[Hashable, object] = TTLCache(ttl=ttl, max_size=max_size)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(models: Iterable[Type[DbController]], *args: Hashable) -> tuple:
+        return (*args, *(model.data_version() for model in models))
+
+    def get(self, key: tuple):
+        value = self._cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: tuple, value) -> None:
+        self._cache.set(key, value)
+
+
+render_cache = RenderCache(ttl=get_config().cache.render_ttl, max_size=get_config().cache.render_max_size)
+
+
+async def answer_chunks(message: types.Message, chunks: list[str], reply_markup=None) -> None:
+    """Sends a long text as several messages, the keyboard goes with the last one"""
+    for chunk in chunks[:-1]:
+        await message.answer(chunk)
+    await message.answer(chunks[-1], reply_markup=reply_markup)
@@ -0,0 +1,197 @@
+import dataclasses
+import heapq
+import re
+from typing import Any, Iterable
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.filters import Command, RegexpCommandsFilter, StateFilter, Text
+from aiogram.dispatcher.filters.filters import FilterNotPassed, FilterObj, check_filters
+from aiogram.dispatcher.handler import CancelHandler, Handler, SkipHandler, ctx_data, current_handler, _check_spec
+
+from bot.sdk.filters import AuthorizedUser
+
+ANY_STATE = '*'
+
+# Filters which may go to the DB, they run after every other filter of the handler
+DB_BACKED_FILTERS = (AuthorizedUser,)
+
+# `order_(\d+)$` is routed by the `order_` prefix of the command
+_COMMAND_WITH_ID = re.compile(r'\^?(\w+)\(\\d\+\)\$')
+
+
+@dataclasses.dataclass
+class _Route:
+    position: int
+    handler_obj: Handler.HandlerObj
+    filters: list[FilterObj]
+
+
+@dataclasses.dataclass
+class _RouteKeys:
+    states: list[Any]
+    texts: list[str] = dataclasses.field(default_factory=list)
+    folded_texts: list[str] = dataclasses.field(default_factory=list)
+    commands: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def is_generic(self) -> bool:
+        return not (self.texts or self.folded_texts or self.commands)
+
+
+def _route_keys(filters: Iterable[FilterObj]) -> _RouteKeys:
+    keys = _RouteKeys(states=[None])
+    for filter_obj in filters:
+        filter_ = filter_obj.filter
+        if isinstance(filter_, StateFilter):
+            keys.states = filter_.states
+        elif isinstance(filter_, Text) and filter_.equals is not None and not keys.commands:
+            if filter_.ignore_case:
+                keys.folded_texts = [str(value).lower() for value in filter_.equals]
+            else:
+                keys.texts = [str(value) for value in filter_.equals]
+        elif isinstance(filter_, Command) and filter_.prefixes == '/' and filter_.ignore_case and not keys.texts:
+            keys.commands = list(filter_.commands)
+        elif isinstance(filter_, RegexpCommandsFilter) and not keys.texts:
+            prefixes = [_COMMAND_WITH_ID.fullmatch(regexp.pattern) for regexp in filter_.regexp_commands]
+            if all(prefixes):
+                keys.commands = [prefix.group(1).lower() for prefix in prefixes]
+    return keys
+
+
+def _command_keys(message: types.Message) -> tuple[str, ...]:
+    if not message.text or not message.text.startswith('/'):
+        return ()
+    command = message.text.split(maxsplit=1)[0][1:].partition('@')[0].lower()
+    prefix = command.rstrip('0123456789')
+    return (command, prefix) if prefix != command else (command,)
+
+
+class MessageRouter(Handler):
+    """
+    Message handler which indexes handlers by (state, button text) and (state, command)
+    Only handlers registered for the current state and the message text or command,
+    plus handlers without such keys, are checked, in their registration order.
+    DB-backed filters of a handler run after its cheap ones.
+    """
+
+    def __init__(self, dispatcher, once=True, middleware_key=None):
+        super().__init__(dispatcher, once=once, middleware_key=middleware_key)
+        self._index: dict[tuple, list[_Route]] | None = None
+
+    def register(self, handler, filters=None, index=None):
+        super().register(handler, filters, index)
+        self._index = None
+
+    def unregister(self, handler):
+        self._index = None
+        return super().unregister(handler)
+
+    def _build_index(self) -> dict[tuple, list[_Route]]:
+        index: dict[tuple, list[_Route]] = {}
+        for position, handler_obj in enumerate(self.handlers):
+            filters = list(handler_obj.filters or ())
+            route = _Route(
+                position=position,
+                handler_obj=handler_obj,
+                filters=sorted(filters, key=lambda item: isinstance(item.filter, DB_BACKED_FILTERS)),
+            )
+            keys = _route_keys(filters)
+            for state in keys.states:
+                if keys.is_generic:
+                    index.setdefault(('any', state), []).append(route)
+                for text in keys.texts:
+                    index.setdefault(('text', state, text), []).append(route)
+                for text in keys.folded_texts:
+                    index.setdefault(('folded', state, text), []).append(route)
+                for command in keys.commands:
+                    index.setdefault(('command', state, command), []).append(route)
+        return index
+
+    async def _current_state(self, message: types.Message) -> str | None:
+        try:
+            return StateFilter.ctx_state.get()
+        except LookupError:
+            state = await self.dispatcher.storage.get_state(chat=message.chat.id, user=message.from_user.id)
+            # StateFilter of every candidate reuses it
+            StateFilter.ctx_state.set(state)
+            return state
+
+    async def routes(self, message: types.Message) -> list[_Route]:
+        """Handlers which may accept the message, in registration order"""
+        if self._index is None:
+            self._index = self._build_index()
+
+        state = await self._current_state(message)
+        text = message.text or message.caption or ''
+        commands = _command_keys(message)
+
+        found = []
+        for state_key in (state, ANY_STATE):
+            found.append(self._index.get(('any', state_key), ()))
+            found.append(self._index.get(('text', state_key, text), ()))
+            found.append(self._index.get(('folded', state_key, text.lower()), ()))
+            for command in commands:
+                found.append(self._index.get(('command', state_key, command), ()))
+
+        routes = []
+        last_position = -1
+        for route in heapq.merge(*found, key=lambda item: item.position):
+            if route.position != last_position:
+                routes.append(route)
+                last_position = route.position
+        return routes
+
+    async def notify(self, *args):
+        """Same as `Handler.notify`, but only over the routed handlers"""
+        results = []
+
+        data = {}
+        ctx_data.set(data)
+
+        if self.middleware_key:
+            try:
+                await self.dispatcher.middleware.trigger(f"pre_process_{self.middleware_key}", args + (data,))
+            except CancelHandler:
+                return results
+
+        try:
+            for route in await self.routes(*args):
+                try:
+                    data.update(await check_filters(route.filters, args))
+                except FilterNotPassed:
+                    continue
+
+                handler_obj = route.handler_obj
+                ctx_token = current_handler.set(handler_obj.handler)
+                try:
+                    if self.middleware_key:
+                        await self.dispatcher.middleware.trigger(f"process_{self.middleware_key}", args + (data,))
+                    partial_data = _check_spec(handler_obj.spec, data)
+                    response = await handler_obj.handler(*args, **partial_data)
+                    if response is not None:
+                        results.append(response)
+                    if self.once:
+                        break
+                except SkipHandler:
+                    continue
+                except CancelHandler:
+                    break
+                finally:
+                    current_handler.reset(ctx_token)
+        finally:
+            if self.middleware_key:
+                await self.dispatcher.middleware.trigger(
+                    f"post_process_{self.middleware_key}",
+                    args + (results, data),
+                )
+
+        return results
+
+
+class RoutedDispatcher(Dispatcher):
+    """Dispatcher whose message handlers are a `MessageRouter`"""
+
+    def _setup_filters(self):
+        # Runs at the end of Dispatcher.__init__, before the filters are bound to the handlers by identity
+        self.message_handlers = MessageRouter(self, middleware_key='message')
+        super()._setup_filters()
@@ -0,0 +1,48 @@
+from typing import Any, Generic, Type, TypeVar
+
+from aiogram.dispatcher.handler import ctx_data
+
+from database.controller import DbController
+
+_M = TypeVar('_M', bound=DbController)
+
+_LOADED_KEY = 'state_refs'
+
+
+class ModelRef(Generic[_M]):
+    """
+    Keeps a DB row in FSM data as its id and a few snapshot fields
+    The row itself is loaded only when a step needs it and at most once per update
+    """
+
+    def __init__(self, model: Type[_M], key: str, snapshot: tuple[str, ...] = ()):
+        self.model = model
+        self.key = key
+        self.snapshot_fields = snapshot
+
+    def store(self, data, instance: _M) -> None:
+        data[self.key] = dict(
+            id=instance.id,
+            **{field: getattr(instance, field) for field in self.snapshot_fields},
+        )
+
+    def get_id(self, data) -> int | None:
+        ref = data.get(self.key)
+        return ref['id'] if ref else None
+
+    def snapshot(self, data) -> dict[str, Any]:
+        return dict(data.get(self.key) or {})
+
+    async def load(self, data) -> _M | None:
+        instance_id = self.get_id(data)
+        if instance_id is None:
+            return None
+
+        try:
+            loaded: dict = ctx_data.get().setdefault(_LOADED_KEY, {})
+        except LookupError:
+            loaded = {}
+        cache_key = (self.model, instance_id)
+        if cache_key not in loaded:
+            loaded[cache_key] = await self.model.get(id=instance_id)
+        return loaded[cache_key]
@@ -0,0 +1,191 @@
+import asyncio
+import collections
+import time
+from datetime import datetime, timedelta
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+from aiohttp import web
+from loguru import logger
+
+from database.models import ProcessedUpdate
+from utils.cell_client import LatencyHistogram
+from utils.config import WebhookConfig, get_config
+
+
+def _chat_id(update: types.Update) -> int:
+    """Updates with the same key are processed one after another"""
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message is not None:
+            return message.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    for event in (update.inline_query, update.chosen_inline_result, update.shipping_query, update.pre_checkout_query):
+        if event is not None:
+            return event.from_user.id
+    return update.update_id
+
+
+class UpdateQueue:
+    """
+    Updates accepted by the webhook wait here to be processed
+    Every chat is bound to one of the bounded shard queues with a worker of its own,
+    so updates of a chat are processed in order and different chats are processed concurrently.
+    An update whose shard is full is refused and Telegram delivers it again later.
+    """
+
+    def __init__(self, config: WebhookConfig):
+        self.config = config
+        self.wait_time = LatencyHistogram(config.wait_buckets)
+        self.processed = 0
+        self.failed = 0
+        self.shed = 0
+        self._dispatcher: Dispatcher | None = None
+        self._shards: list[asyncio.Queue[tuple[float, types.Update]]] = []
+        self._workers: list[asyncio.Task] = []
+
+    def start(self, dispatcher: Dispatcher) -> None:
+        self._dispatcher = dispatcher
+        self._shards = [asyncio.Queue(maxsize=self.config.queue_size) for _ in range(self.config.workers)]
+        self._workers = [asyncio.create_task(self._worker(shard)) for shard in self._shards]
+
+    async def stop(self) -> None:
+        """Waits up to `drain_timeout` for the queued updates, the rest are dropped"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(shard.join() for shard in self._shards)),
+                self.config.drain_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f'{self.depth()} queued updates are dropped on shutdown')
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def put(self, update: types.Update) -> bool:
+        """
+        :return: False if the shard of the chat is full
+        """
+        shard = self._shards[_chat_id(update) % len(self._shards)]
+        try:
+            shard.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.shed += 1
+            return False
+        return True
+
+    def depth(self) -> int:
+        return sum(shard.qsize() for shard in self._shards)
+
+    async def _worker(self, shard: asyncio.Queue) -> None:
+        while True:
+            queued_at, update = await shard.get()
+            self.wait_time.observe(time.monotonic() - queued_at)
+            try:
+                # A task of its own gives every update fresh context variables,
+                # like the current update and the state cached by StateFilter
+                await asyncio.create_task(self._process(update))
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception(f'Update {update.update_id} failed: {e}')
+            finally:
+                shard.task_done()
+
+    async def _process(self, update: types.Update) -> None:
+        Dispatcher.set_current(self._dispatcher)
+        Bot.set_current(self._dispatcher.bot)
+        # Same entry point as aiogram's webhook, so update middlewares run
+        await self._dispatcher.updates_handler.notify(update)
+
+    def stats(self) -> str:
+        depths = [shard.qsize() for shard in self._shards]
+        wait = self.wait_time.as_text() if self.wait_time.count else 'n=0'
+        return (
+            f'Очередь: {sum(depths)}, max {max(depths, default=0)} в шарде из {self.config.queue_size}\n'
+            f'Обработано: {self.processed}, ошибок: {self.failed}, отклонено: {self.shed}\n'
+            f'Ожидание: {wait}'
+        )
+
+
+class UpdateDeduplicator:
+    """
+    Recognizes updates Telegram delivers again, e.g. after a slow response
+    Ids of the last `dedup_size` updates are kept in memory, with `dedup_shared`
+    they are also claimed in the `processed_updates` table, so replicas behind
+    one webhook do not process the same update twice
+    """
+
+    def __init__(self, config: WebhookConfig):
+        self.config = config
+        self.duplicates = 0
+        self._recent: collections.deque[int] = collections.deque()
+        self._recent_set: set[int] = set()
+
+    def _remember(self, update_id: int) -> None:
+        if len(self._recent) >= self.config.dedup_size:
+            self._recent_set.discard(self._recent.popleft())
+        self._recent.append(update_id)
+        self._recent_set.add(update_id)
+
+    async def first_seen(self, update_id: int) -> bool:
+        if update_id in self._recent_set:
+            self.duplicates += 1
+            return False
+        # Not remembered when claimed by another replica, it may still refuse and forget the update
+        if self.config.dedup_shared and not await ProcessedUpdate.claim(update_id):
+            self.duplicates += 1
+            return False
+        self._remember(update_id)
+        return True
+
+    async def forget(self, update_id: int) -> None:
+        """For an accepted update which was not processed, so its redelivery is"""
+        if update_id in self._recent_set:
+            self._recent_set.discard(update_id)
+            self._recent.remove(update_id)
+        if self.config.dedup_shared:
+            await ProcessedUpdate.release(update_id)
+
+    async def run_pruning(self) -> None:
+        while True:
+            try:
+                pruned = await ProcessedUpdate.prune(datetime.now() - timedelta(seconds=self.config.dedup_window))
+                logger.debug(f'Pruned {pruned} processed updates')
+            except Exception as e:
+                logger.warning(f'Processed updates pruning failed: {e}')
+            await asyncio.sleep(self.config.dedup_prune_interval)
+
+
+class QueuedWebhookRequestHandler(WebhookRequestHandler):
+    """
+    Acknowledges an update as soon as it is queued, handlers run after the response is sent
+    Updates delivered again are acknowledged without being queued
+    """
+
+    async def post(self):
+        self.validate_ip()
+        dispatcher = self.get_dispatcher()
+        update = await self.parse_update(dispatcher.bot)
+        if not await get_deduplicator().first_seen(update.update_id):
+            logger.info(f'Update {update.update_id} is delivered again, skipped')
+            return web.Response(text='ok')
+        if not get_update_queue().put(update):
+            logger.warning(f'Update {update.update_id} is refused, the queue is full')
+            await get_deduplicator().forget(update.update_id)
+            return web.Response(status=503, text='overloaded')
+        return web.Response(text='ok')
+
+
+update_queue = UpdateQueue(get_config().webhook)
+deduplicator = UpdateDeduplicator(get_config().webhook)
+
+
+def get_update_queue() -> UpdateQueue:
+    return update_queue
+
+
+def get_deduplicator() -> UpdateDeduplicator:
+    return deduplicator
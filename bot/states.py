@@ -1,5 +1,8 @@
 from aiogram.dispatcher.filters.state import State, StatesGroup
 
+from bot.sdk.state_refs import ModelRef
+from database.models import Document, Order, User
+
 
 class FirstInvitation(StatesGroup):
     token_enter = State()
@@ -8,6 +11,8 @@ class FirstInvitation(StatesGroup):
 class DocumentView(StatesGroup):
     action = State()
 
+    document = ModelRef(Document, 'document', snapshot=('name',))
+
 
 class DocumentManageView(StatesGroup):
     action = State()
@@ -34,6 +39,8 @@ class OrderDetailedView(StatesGroup):
     action = State()
     status = State()
 
+    order = ModelRef(Order, 'order', snapshot=('status_id',))
+
 
 class WorkerManage(StatesGroup):
     action = State()
@@ -55,14 +62,20 @@ class WorkerManageDeleteWorker(StatesGroup):
 class WorkerDetailedView(StatesGroup):
     action = State()
 
+    worker = ModelRef(User, 'worker', snapshot=('username',))
+
 
 class WorkerAskDocument(StatesGroup):
     document = State()
 
+    worker = ModelRef(User, 'worker', snapshot=('username',))
+
 
 class DocumentAskedByWorker(StatesGroup):
     action = State()
 
+    document = ModelRef(Document, 'document', snapshot=('name',))
+
 
 class CellManage(StatesGroup):
     action = State()
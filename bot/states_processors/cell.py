@@ -0,0 +1,42 @@
+from typing import Match
+
+from aiogram import types, Dispatcher
+from aiogram.dispatcher.filters import RegexpCommandsFilter
+
+from bot.sdk.filters import AuthorizedUser
+from bot.sdk.render import ListTemplate
+from database.models import Cell, UserRole
+
+OUT_OF_SERVICE_LIST: ListTemplate[Cell] = ListTemplate(
+    header='Ячейки вне работы:\n',
+    row=lambda cell: f'№{cell.id}\t\t/repair_cell_{cell.id}\n',
+)
+
+
+async def list_out_of_service_cells(message: types.Message):
+    cells: list[Cell] = await Cell.get_out_of_service()
+    if not cells:
+        await message.answer("Все ячейки в работе")
+        return
+    await message.answer(OUT_OF_SERVICE_LIST.render(cells))
+
+
+async def repair_cell(message: types.Message, regexp_command: Match):
+    cell_id = int(regexp_command.group(1))
+    if await Cell.return_to_service(cell_id) is None:
+        await message.answer(f"Ячейка №{cell_id} не выведена из работы")
+        return
+    await message.answer(f"Ячейка №{cell_id} снова в работе")
+
+
+async def register_handlers(dp: Dispatcher):
+    dp.message_handler(
+        AuthorizedUser(user_role=UserRole.ACCOUNTANT),
+        commands='cells',
+        state='*',
+    )(list_out_of_service_cells)
+    dp.message_handler(
+        RegexpCommandsFilter(regexp_commands=[r'repair_cell_(\d+)$']),
+        AuthorizedUser(user_role=UserRole.ACCOUNTANT),
+        state='*',
+    )(repair_cell)
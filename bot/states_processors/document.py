@@ -4,26 +4,35 @@ from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text, RegexpCommandsFilter
 
-from bot.sdk.common import list_documents, list_workers, create_order_by_accountant
+from bot.sdk.common import list_documents, list_workers, create_order_by_accountant, turn_page, page_callback
 from bot.sdk.filters import AuthorizedUser, not_cancel
 from bot.sdk.keyboards import MainMenuKeyBoard, DocumentActionKeyBoard, DocumentManageActionKeyBoard
+from bot.sdk.render import ListTemplate, answer_chunks
 from bot.states import DocumentView, DocumentManageView, DocumentManageAddView, DocumentManageDeleteView, \
     WorkerAskDocument, DocumentAskedByWorker
+from database.db_core import unit_of_work
+from database.document_catalog import document_catalog
 from database.models import (
     User, Document, Order, OrderStatus, UserRole,
 )
+from utils.functions import split_text
+
+ORDER_LINKS: ListTemplate[Order] = ListTemplate(
+    header='',
+    row=lambda order: f'№{order.id}\t\t/order_{order.id}\n',
+)
 
 
 async def view_document(message: types.Message, regexp_command: Match, user: User):
     doc_id = int(regexp_command.group(1))
-    document = await Document.get(id=doc_id, is_deleted=False)
-    if not document:
+    document = await document_catalog.get(doc_id)
+    if not document or document.is_deleted:
         await message.answer(f"Документ не найден")
         return
 
     await DocumentView.action.set()
     async with Dispatcher.get_current().current_state().proxy() as data:
-        data['document'] = document
+        DocumentView.document.store(data, document)
 
     await message.answer(
         f"Документ: {document.name}\nЧто вы хотите сделать?",
@@ -33,38 +42,45 @@ async def view_document(message: types.Message, regexp_command: Match, user: Use
 
 async def id_delete_document(message: types.Message, user: User, state: FSMContext):
     async with state.proxy() as data:
-        document: Document = data['document']
+        document: Document | None = await DocumentView.document.load(data)
         await state.finish()
-        await __delete_doc(document, user, message)
+    if not document or document.is_deleted:
+        await message.answer(
+            f"Документ не найден",
+            reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
+        )
+        return
+    await __delete_doc(document, user, message)
 
 
 async def ask_for_document(message: types.Message, user: User, state: FSMContext):
     async with state.proxy() as data:
-        document = data['document']
+        document_ref = DocumentView.document.snapshot(data)
 
     await state.finish()
 
     if user.role_id == UserRole.ACCOUNTANT:
         await DocumentAskedByWorker.action.set()
         async with Dispatcher.get_current().current_state().proxy() as data:
-            data['document'] = document
+            data[DocumentAskedByWorker.document.key] = document_ref
             await list_workers(message, user)
         return
 
-    order = await Order.get_not_completed_order(document_id=document.id, receiver_id=user.id)
-    if order:
+    # Always the same accountant, so repeated requests of a worker meet the same active order
+    async with unit_of_work():
+        accountant: User = await User.get(role_id=UserRole.ACCOUNTANT, is_deleted=False, order_by=User.id)
+        order, created = await Order.create_or_get_active(
+            sender_id=accountant.id,
+            document_id=document_ref['id'],
+            receiver_id=user.id,
+        )
+    if not created:
         await message.answer(
             f"У вас уже есть сформированная заявка №{order.id} на данный документ",
             reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
         )
         return
 
-    accountant: User = await User.get(role_id=UserRole.ACCOUNTANT, is_deleted=False)  # Fetching any accountant
-    order = await Order.create_with_push(
-        sender_id=accountant.id,
-        document_id=document.id,
-        receiver_id=user.id,
-    )
     await message.answer(
         f"Заявка №{order.id} успешно сформирована",
         reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
@@ -73,16 +89,16 @@ async def ask_for_document(message: types.Message, user: User, state: FSMContext
 
 async def ask_for_document_by_accountant(message: types.Message, user: User, state: FSMContext, regexp_command: Match):
     doc_id = int(regexp_command.group(1))
-    document = await Document.get(id=doc_id, is_deleted=False)
-    if not document:
+    document = await document_catalog.get(doc_id)
+    if not document or document.is_deleted:
         await message.answer(f"Документ не найден")
         return
 
     async with state.proxy() as data:
-        worker: User = data.get('worker')
+        worker_id = WorkerAskDocument.worker.get_id(data)
 
     await state.finish()
-    await create_order_by_accountant(message, user, document, worker)
+    await create_order_by_accountant(message, user, document_id=document.id, worker_id=worker_id)
 
 
 async def manage_start_document(message: types.Message, user: User):
@@ -104,8 +120,8 @@ async def manage_delete_document(message: types.Message, state: FSMContext):
 
 
 async def manage_finish_delete_document(message: types.Message, state: FSMContext, user: User):
-    document: Document = await Document.get(name=message.text, is_deleted=False)
-    if not document:
+    document: Document = await document_catalog.get_by_name(message.text)
+    if not document or document.is_deleted:
         await message.answer("Документ не найден")
         return
 
@@ -127,12 +143,14 @@ async def manage_finish_add_document(message: types.Message, state: FSMContext,
         await message.answer("Название слишком короткое, введите снова")
         return
 
-    document: Document = await Document.get(name=message.text)
+    document: Document = await document_catalog.get_by_name(message.text)
     if document and not document.is_deleted:
         await message.answer("Такой документ уже существует")
         return
 
     if document and document.is_deleted:
+        # Written through the current row, not the catalog copy
+        document = await Document.get(id=document.id)
         new_doc = await document.update(is_deleted=False)
     else:
         new_doc = await Document.create(name=message.text)
@@ -145,17 +163,24 @@ async def manage_finish_add_document(message: types.Message, state: FSMContext,
 
 
 async def __delete_doc(document: Document, user: User, message: types.Message):
+    # Written through the current row, not the catalog copy or the state snapshot
+    document = await Document.get(id=document.id)
+    if not document or document.is_deleted:
+        await message.answer(
+            f"Документ не найден",
+            reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
+        )
+        return
+
     orders: list[Order] = await Order.get_list_for_view(
         statuses=(OrderStatus.NEW, OrderStatus.PROCESSING, OrderStatus.READY),
         document_id=document.id,
     )
     if orders:
         text = f"Документ {document.name} не может быть удален. У него остались активные заявки:\n"
-        for order in orders:
-            text += f'№{order.id}\t\t/order_{order.id}\n'
-
-        await message.answer(
-            text,
+        await answer_chunks(
+            message,
+            split_text(text + ORDER_LINKS.render(orders)),
             reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
         )
         return
@@ -168,6 +193,12 @@ async def __delete_doc(document: Document, user: User, message: types.Message):
 
 
 async def register_handlers(dp: Dispatcher):
+    dp.callback_query_handler(
+        page_callback.filter(view='doc'),
+        AuthorizedUser(return_user=True),
+        state='*',
+    )(turn_page)
+
     dp.message_handler(
         Text(equals=MainMenuKeyBoard.Button.doc_list.value),
         AuthorizedUser(),
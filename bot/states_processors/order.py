@@ -1,19 +1,27 @@
+import re
+from datetime import datetime, timedelta
 from typing import Match
 
 from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text, RegexpCommandsFilter
 
-from bot.sdk.common import get_order_view
+from bot.sdk.common import send_page, turn_page, page_callback, open_free_cell
 from bot.sdk.filters import AuthorizedUser
 from bot.sdk.keyboards import MainMenuKeyBoard, OrderViewTypeKeyBoard, OrderActionKeyBoard, OrderViewToKeyBoard, \
     OrderDetailedViewKeyBoard, OrderChangeStatusKeyBoard
 from bot.states import OrderView, OrderMain, OrderDetailedView
-from database.aiogram_storage import get_channel
+from database.db_core import unit_of_work
+from database.document_catalog import document_catalog
 from database.models import (
-    User, Document, Order, OrderStatus, UserRole, Cell,
+    User, Order, OrderStatus, UserRole, Cell,
 )
-from utils.rabbit import queue_cell_open
+from utils.cell_client import CellOpenResult, get_cell_client
+
+CELL_FAILURES = {
+    CellOpenResult.REFUSED: "Не удалось открыть ячейку. Обратитесь к бухгалтеру.",
+    CellOpenResult.NO_REPLY: "Ячейки не отвечают, попробуйте позже.",
+}
 
 
 async def start_order_main_menu(message: types.Message, user: User):
@@ -37,9 +45,9 @@ async def view_order_to_menu(message: types.Message, user: User, state: FSMConte
     await OrderView.to.set()
     async with state.proxy() as data:
         if message.text == OrderViewTypeKeyBoard.Button.new:
-            data['statuses'] = OrderStatus.NEW, OrderStatus.PROCESSING, OrderStatus.READY
+            data['statuses'] = 'a'
         elif message.text == OrderViewTypeKeyBoard.Button.old:
-            data['statuses'] = OrderStatus.DONE, OrderStatus.DECLINED
+            data['statuses'] = 'd'
 
     await message.answer(
         "От вас или вам?",
@@ -49,35 +57,34 @@ async def view_order_to_menu(message: types.Message, user: User, state: FSMConte
 
 async def view_order_show(message: types.Message, user: User, state: FSMContext):
     async with state.proxy() as data:
-        if message.text == OrderViewToKeyBoard.Button.to_me:
-            data['receiver_id'] = user.id
-        else:
-            data['sender_id'] = user.id
-
-        text = 'Список заявок:\n'
-        orders = await Order.get_list_for_view(**data)
-        text = await get_order_view(orders, user)
-        await message.answer(
-            text,
-            reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
-        )
+        statuses = data.get('statuses', 'a')
     await state.finish()
 
+    direction = 'r' if message.text == OrderViewToKeyBoard.Button.to_me else 's'
+    await send_page(
+        message,
+        user,
+        'ord',
+        filter_=statuses + direction,
+        reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
+    )
+
 
 async def view_single_order(message: types.Message, regexp_command: Match, user: User):
     order_id = int(regexp_command.group(1))
-    order: Order = await Order.get(id=order_id)
+    async with unit_of_work():
+        order: Order = await Order.get(id=order_id)
+        document = await document_catalog.get(order.document_id) if order else None
     if not order:
         await message.answer(f"Заявки не найден")
         return
 
-    document = await Document.get(id=order.document_id)
     text = f'Заявка №{order.id}. [{OrderStatus.get_str_by_id(order.status_id)}] {document.name}\n'
 
     await OrderDetailedView.action.set()
     _with_open_cell = False
     async with Dispatcher.get_current().current_state().proxy() as data:
-        data['order'] = order
+        OrderDetailedView.order.store(data, order)
 
         if order.sender_id == user.id and order.status_id in {OrderStatus.NEW, OrderStatus.PROCESSING}:
             data['is_sender'] = True
@@ -101,62 +108,137 @@ async def view_single_order(message: types.Message, regexp_command: Match, user:
 
 async def cell_begin_order(message: types.Message, user: User, state: FSMContext):
     async with state.proxy() as data:
-        order: Order = data['order']
+        order_id = OrderDetailedView.order.get_id(data)
         is_sender: bool = data['is_sender']
-        if is_sender:
-            cell: Cell | None = await Cell.get(order_id=None, is_open=True)
-            if cell is None:
-                await message.answer(
-                    f"Нет свободных ячеек",
-                    reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
-                )
-                await state.finish()
-                return
-            await cell.update(order_id=order.id, is_open=False)
-        else:
-            cell: Cell | None = await Cell.get(order_id=order.id)
-            if cell is None:
-                await message.answer(
-                    f"Нет ячейки с вашей заявкой. Обратитесь к бухгалтеру.",
-                    reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
-                )
-                await state.finish()
-                return
-    await queue_cell_open(
-        channel=get_channel(),
-        cell_id=cell.id,
-        is_sending=is_sender,
-    )
+    await state.finish()
+
+    if is_sender:
+        cell, result = await open_free_cell(order_id)
+        if cell is None:
+            await message.answer(
+                CELL_FAILURES.get(result, "Нет свободных ячеек"),
+                reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
+            )
+            return
+    else:
+        cell_id = await Cell.get_id_by_order(order_id)
+        if cell_id is None:
+            await message.answer(
+                f"Нет ячейки с вашей заявкой. Обратитесь к бухгалтеру.",
+                reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
+            )
+            return
+        result = await get_cell_client().open_cell(cell_id, is_sending=False)
+        if result is not CellOpenResult.OPENED:
+            await message.answer(
+                CELL_FAILURES[result],
+                reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
+            )
+            return
+
     await message.answer(
         f"Ячейка открыта",
         reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
     )
-    await state.finish()
 
 
 async def choose_status_order(message: types.Message, user: User, state: FSMContext):
+    async with state.proxy() as data:
+        status_id = OrderDetailedView.order.snapshot(data).get('status_id')
     await OrderDetailedView.status.set()
     await message.answer(
         f"Выберете статус",
-        reply_markup=await OrderChangeStatusKeyBoard.get_reply_markup(user),
+        reply_markup=await OrderChangeStatusKeyBoard.get_reply_markup(user, current=status_id),
     )
 
 
 async def change_status_order(message: types.Message, user: User, state: FSMContext):
     async with state.proxy() as data:
-        order: Order = data['order']
-        was = OrderStatus.get_str_by_id(order.status_id)
-        new = OrderStatus.get_id_by_str(message.text)
-        await order.change_status(new)
+        order_ref = OrderDetailedView.order.snapshot(data)
+    await state.finish()
+    reply_markup = await MainMenuKeyBoard.get_reply_markup(user)
+    if not order_ref:
+        await message.answer(f"Заявки не найден", reply_markup=reply_markup)
+        return
 
+    was = order_ref['status_id']
+    new = OrderStatus.get_id_by_str(message.text)
+    if not OrderStatus.can_transition(was, new):
         await message.answer(
-            f"Статус успешно изменен {was} -> {message.text}",
-            reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
+            f"Нельзя изменить статус {OrderStatus.get_str_by_id(was)} -> {message.text}",
+            reply_markup=reply_markup,
+        )
+        return
+
+    async with unit_of_work():
+        changed, current = await Order.change_status(order_ref['id'], expected_status_id=was, status_id=new)
+    if current is None:
+        await message.answer(f"Заявки не найден", reply_markup=reply_markup)
+    elif not changed:
+        await message.answer(
+            f"Статус заявки уже изменен на {OrderStatus.get_str_by_id(current)}, "
+            f"откройте /order_{order_ref['id']} еще раз",
+            reply_markup=reply_markup,
+        )
+    else:
+        await message.answer(
+            f"Статус успешно изменен {OrderStatus.get_str_by_id(was)} -> {message.text}",
+            reply_markup=reply_markup,
         )
-    await state.finish()
+
+
+async def bulk_change_status(message: types.Message, user: User):
+    """
+    /bulk_status ready done 3d - ready orders whose status has not changed for 3 days
+    /bulk_status ready done 12 15 - listed ready orders
+    """
+    args = message.get_args().split()
+    usage = (
+        "/bulk_status <из статуса> <в статус> [<дней>d | <номера заявок>]\n"
+        f"Статусы: {', '.join(OrderStatus.short_names.by_name)}"
+    )
+    if len(args) < 2:
+        await message.answer(usage)
+        return
+    was = OrderStatus.short_names.id(args[0])
+    new = OrderStatus.short_names.id(args[1])
+    if was is None or new is None:
+        await message.answer(usage)
+        return
+    if not OrderStatus.can_transition(was, new):
+        await message.answer(
+            f"Нельзя изменить статус {OrderStatus.get_str_by_id(was)} -> {OrderStatus.get_str_by_id(new)}",
+        )
+        return
+
+    order_ids = None
+    changed_before = None
+    selection = args[2:]
+    if len(selection) == 1 and re.fullmatch(r'\d+d', selection[0]):
+        changed_before = datetime.now() - timedelta(days=int(selection[0][:-1]))
+    elif selection:
+        if not all(arg.isdigit() for arg in selection):
+            await message.answer(usage)
+            return
+        order_ids = [int(arg) for arg in selection]
+
+    changed = await Order.change_status_bulk(was, new, order_ids=order_ids, changed_before=changed_before)
+    if not changed:
+        await message.answer(f"Подходящих заявок в статусе {OrderStatus.get_str_by_id(was)} нет")
+        return
+    await message.answer(
+        f"Статус изменен {OrderStatus.get_str_by_id(was)} -> {OrderStatus.get_str_by_id(new)} "
+        f"у {len(changed)} заявок",
+    )
 
 
 async def register_handlers(dp: Dispatcher):
+    dp.callback_query_handler(
+        page_callback.filter(view='ord'),
+        AuthorizedUser(return_user=True),
+        state='*',
+    )(turn_page)
+
     dp.message_handler(
         Text(equals=MainMenuKeyBoard.Button.orders.value),
         AuthorizedUser(return_user=True),
@@ -196,3 +278,7 @@ async def register_handlers(dp: Dispatcher):
         AuthorizedUser(return_user=True, user_role=UserRole.ACCOUNTANT),
         state=OrderDetailedView.status,
     )(change_status_order)
+    dp.message_handler(
+        AuthorizedUser(return_user=True, user_role=UserRole.ACCOUNTANT),
+        commands='bulk_status',
+    )(bulk_change_status)
@@ -5,18 +5,21 @@ from aiogram import types, Dispatcher
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text, RegexpCommandsFilter
 
-from bot.sdk.common import get_order_view, list_documents, list_workers, create_order_by_accountant
+from bot.sdk.common import get_order_view, list_documents, list_workers, create_order_by_accountant, send_page, \
+    turn_page, page_callback
 from bot.sdk.filters import AuthorizedUser, not_cancel
 from bot.sdk.keyboards import MainMenuKeyBoard, WorkerManageActionKeyBoard, WorkerManageAddInvitationRoleKeyBoard, \
     WorkerDetailedViewKeyBoard
+from bot.sdk.render import answer_chunks
 from bot.states import (
     WorkerManage,
     WorkerManageAddInvite, WorkerManageDeleteInvite, WorkerManageDeleteWorker, WorkerDetailedView, WorkerAskDocument,
     DocumentAskedByWorker,
 )
 from database.models import (
-    User, UserRole, Invitation, Order, Document,
+    User, UserRole, Invitation, Order,
 )
+from utils.functions import split_text
 
 
 async def manage_start(message: types.Message, user: User):
@@ -30,13 +33,10 @@ async def manage_start(message: types.Message, user: User):
 
 async def manage_view_invitation(message: types.Message, state: FSMContext, user: User):
     await state.finish()
-    invitation: list[Invitation] = await Invitation.get_all()
-
-    text = 'Приглашения: \n'
-    for invite in invitation:
-        text += f'{invite.id}. {invite.username} -- {UserRole.get_str_by_id(invite.role_id)}\n\n'
-    await message.answer(
-        text,
+    await send_page(
+        message,
+        user,
+        'inv',
         reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
     )
 
@@ -151,7 +151,7 @@ async def manage_worker_delete_action(message: types.Message, state: FSMContext,
         )
         return
 
-    orders = await Order.get_all_not_completed_order(worker.id)
+    orders = await Order.get_all_not_completed_order(worker.id, with_related=True)
     if not orders:
         await worker.update(is_deleted=True)
         await message.answer(
@@ -160,10 +160,10 @@ async def manage_worker_delete_action(message: types.Message, state: FSMContext,
         )
         return
 
-    text = 'У данного работника имеются не завершенные заказы. Измените статус.\n\n'
-    text += await get_order_view(orders, user)
-    await message.answer(
-        text,
+    text = 'У данного работника имеются не завершенные заказы. Измените статус.\n\n' + await get_order_view(orders, user)
+    await answer_chunks(
+        message,
+        split_text(text),
         reply_markup=await MainMenuKeyBoard.get_reply_markup(user),
     )
     await state.finish()
@@ -178,7 +178,7 @@ async def detailed_view_worker(message: types.Message, regexp_command: Match, us
 
     await WorkerDetailedView.action.set()
     async with Dispatcher.get_current().current_state().proxy() as data:
-        data['worker'] = worker
+        WorkerDetailedView.worker.store(data, worker)
 
     await message.answer(
         f"Работник: №{worker.id}. {worker.username}\nЧто вы хотите сделать?",
@@ -194,32 +194,37 @@ async def ask_for_document_by_accountant(message: types.Message, state: FSMConte
         return
 
     async with state.proxy() as data:
-        document: Document = data['document']
+        document_id = DocumentAskedByWorker.document.get_id(data)
 
     await state.finish()
-    await create_order_by_accountant(message, user, document, worker)
+    await create_order_by_accountant(message, user, document_id=document_id, worker_id=worker.id)
 
 
 async def detailed_view_delete_worker(message: types.Message, user: User, state: FSMContext):
     async with state.proxy() as data:
-        worker: User = data['worker']
-        message.text = worker.id
-        await manage_worker_delete_action(message, state, user)
+        message.text = str(WorkerDetailedView.worker.get_id(data))
+    await manage_worker_delete_action(message, state, user)
 
 
 async def detailed_view_order_document_worker(message: types.Message, user: User, state: FSMContext):
     async with state.proxy() as data:
-        worker: User = data['worker']
+        worker_ref = WorkerDetailedView.worker.snapshot(data)
 
     await state.finish()
     await WorkerAskDocument.document.set()
     async with Dispatcher.get_current().current_state().proxy() as data:
-        data['worker'] = worker
+        data[WorkerAskDocument.worker.key] = worker_ref
     await message.answer("Выберете документ")
     await list_documents(message)
 
 
 async def register_handlers(dp: Dispatcher):
+    dp.callback_query_handler(
+        page_callback.filter(view=['wrk', 'inv']),
+        AuthorizedUser(return_user=True, user_role=UserRole.ACCOUNTANT),
+        state='*',
+    )(turn_page)
+
     dp.message_handler(
         Text(MainMenuKeyBoard.Button.admin_manage_worker.value),
         AuthorizedUser(return_user=True, user_role=UserRole.ACCOUNTANT),
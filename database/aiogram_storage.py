@@ -1,8 +1,260 @@
-import aio_pika
+import copy
+import dataclasses
+import typing
+from collections import OrderedDict
+from contextvars import ContextVar, Token
+
+import sqlalchemy as sa
+import ujson
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+from sqlalchemy.dialects.postgresql import insert
+
+from database.db_core import Base, Engine
+from utils.config import get_config, FsmStorageConfig
+
+fsm_states = sa.Table(
+    'fsm_states',
+    Base.metadata,
+    sa.Column('chat_id', sa.BigInteger(), primary_key=True),
+    sa.Column('user_id', sa.BigInteger(), primary_key=True),
+    sa.Column('state', sa.String()),
+    sa.Column('data', sa.Text(), nullable=False, server_default='{}'),
+    sa.Column('bucket', sa.Text(), nullable=False, server_default='{}'),
+    # Changes on every write and is never reused, so a replica can tell the row was written after its read
+    sa.Column('version', sa.BigInteger(), nullable=False, server_default=sa.text("nextval('fsm_states_version_seq')")),
+)
+fsm_state_versions = sa.Sequence('fsm_states_version_seq', metadata=Base.metadata)
+
+_EMPTY = '{}'
+_Address = tuple[int, int]
+
+
+@dataclasses.dataclass
+class _Record:
+    state: str | None = None
+    data: str = _EMPTY
+    bucket: str = _EMPTY
+    # Version of the row the record was read from, None if there was no row
+    version: int | None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and self.data == _EMPTY and self.bucket == _EMPTY
+
+
+@dataclasses.dataclass
+class _UpdateScope:
+    """Records read and changed while processing one update"""
+    records: dict[_Address, _Record] = dataclasses.field(default_factory=dict)
+    changed: set[_Address] = dataclasses.field(default_factory=set)
+
+
+_update_scope: ContextVar[_UpdateScope | None] = ContextVar('fsm_update_scope', default=None)
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM storage persisted in the `fsm_states` table
+    State, data and bucket are kept as compact JSON strings. Changes are written through to the DB:
+    right away, or inside `begin_update`/`end_update` once per update, so a handler which sets
+    both the state and the data costs one statement.
+    With a single replica the records are also kept in an LRU cache which is authoritative,
+    with several replicas the DB is read once per update and a record is written only if nobody
+    wrote it since it was read, otherwise the write fails and the changes of the update are dropped.
+    """
+
+    def __init__(self, cache_size: int, replicas: int = 1):
+        self.cache_size = cache_size
+        self.replicas = replicas
+        self._cache: OrderedDict[_Address, _Record] = OrderedDict()
+
+    @property
+    def _cache_is_authoritative(self) -> bool:
+        return self.replicas == 1
+
+    def _address(self, chat, user) -> _Address:
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def begin_update(self) -> Token:
+        return _update_scope.set(_UpdateScope())
+
+    async def end_update(self, token: Token) -> None:
+        """Writes the records changed by the update"""
+        scope = _update_scope.get()
+        _update_scope.reset(token)
+        if scope is not None and scope.changed:
+            await self._write({address: scope.records[address] for address in scope.changed})
+
+    async def _get_record(self, chat, user) -> tuple[_Address, _Record]:
+        address = self._address(chat, user)
+        scope = _update_scope.get()
+        if scope is not None and address in scope.records:
+            return address, scope.records[address]
+        record = self._cache.get(address) if self._cache_is_authoritative else None
+        if record is not None:
+            self._cache.move_to_end(address)
+        else:
+            record = await self._read(address)
+            if self._cache_is_authoritative:
+                self._remember(address, record)
+        if scope is not None:
+            scope.records[address] = record
+        return address, record
+
+    async def _read(self, address: _Address) -> _Record:
+        async with Engine.connect() as connection:
+            row = (await connection.execute(
+                sa.select(fsm_states.c.state, fsm_states.c.data, fsm_states.c.bucket, fsm_states.c.version).where(
+                    fsm_states.c.chat_id == address[0],
+                    fsm_states.c.user_id == address[1],
+                ),
+            )).first()
+        return _Record(state=row.state, data=row.data, bucket=row.bucket, version=row.version) if row else _Record()
+
+    def _remember(self, address: _Address, record: _Record) -> None:
+        self._cache[address] = record
+        self._cache.move_to_end(address)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _changed(self, address: _Address, record: _Record) -> None:
+        scope = _update_scope.get()
+        if scope is not None:
+            scope.changed.add(address)
+            return
+        await self._write({address: record})
+
+    async def _write(self, records: dict[_Address, _Record]) -> None:
+        """
+        :raise RuntimeError: if another replica wrote one of the records since it was read
+        """
+        try:
+            async with Engine.begin() as connection:
+                for address, record in records.items():
+                    record.version = await self._write_record(connection, address, record)
+        except Exception:
+            # The cache must not keep changes the DB does not have
+            for address in records:
+                self._cache.pop(address, None)
+            raise
+
+    async def _write_record(self, connection, address: _Address, record: _Record) -> int | None:
+        """
+        Upserts the record or deletes the row of an empty one
+        :return: the new version of the row, None if it is deleted
+        """
+        # The cache of a single replica is the latest record, there is nobody to conflict with
+        guarded = not self._cache_is_authoritative
+        key = (fsm_states.c.chat_id == address[0], fsm_states.c.user_id == address[1])
+        if record.is_empty:
+            if guarded and record.version is None:
+                return None
+            query = sa.delete(fsm_states).where(*key)
+            if guarded:
+                query = query.where(fsm_states.c.version == record.version)
+            written = (await connection.execute(query)).rowcount > 0
+            if guarded and not written:
+                raise RuntimeError(f'FSM record of {address} was changed by another replica')
+            return None
+
+        values = dict(state=record.state, data=record.data, bucket=record.bucket)
+        query = insert(fsm_states).values(chat_id=address[0], user_id=address[1], **values)
+        query = query.on_conflict_do_update(
+            index_elements=[fsm_states.c.chat_id, fsm_states.c.user_id],
+            set_=dict(version=fsm_state_versions.next_value(), **values),
+            # A row nobody had when the record was read never matches, as the version is not null
+            where=(fsm_states.c.version == record.version) if guarded else None,
+        ).returning(fsm_states.c.version)
+        version = (await connection.execute(query)).scalar()
+        if version is None:
+            raise RuntimeError(f'FSM record of {address} was changed by another replica')
+        return version
+
+    async def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        _, record = await self._get_record(chat, user)
+        return record.state if record.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get_record(chat, user)
+        if record.data == _EMPTY and default is not None:
+            return copy.deepcopy(default)
+        return ujson.loads(record.data)
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        address, record = await self._get_record(chat, user)
+        record.state = self.resolve_state(state)
+        await self._changed(address, record)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        address, record = await self._get_record(chat, user)
+        record.data = ujson.dumps(data or {})
+        await self._changed(address, record)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        address, record = await self._get_record(chat, user)
+        current = ujson.loads(record.data)
+        current.update(data or {}, **kwargs)
+        record.data = ujson.dumps(current)
+        await self._changed(address, record)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get_record(chat, user)
+        if record.bucket == _EMPTY and default is not None:
+            return copy.deepcopy(default)
+        return ujson.loads(record.bucket)
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        address, record = await self._get_record(chat, user)
+        record.bucket = ujson.dumps(bucket or {})
+        await self._changed(address, record)
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        address, record = await self._get_record(chat, user)
+        current = ujson.loads(record.bucket)
+        current.update(bucket or {}, **kwargs)
+        record.bucket = ujson.dumps(current)
+        await self._changed(address, record)
+
 
-storage = MemoryStorage()
+def create_storage(config: FsmStorageConfig) -> BaseStorage:
+    if config.backend == 'postgres':
+        return PostgresStorage(cache_size=config.cache_size, replicas=config.replicas)
+    return MemoryStorage()
 
 
-def get_channel() -> aio_pika.channel.Channel:
-    return storage.data['rmq_channel']['channel']
+storage = create_storage(get_config().fsm)
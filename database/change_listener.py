@@ -0,0 +1,56 @@
+import asyncio
+
+import asyncpg
+from loguru import logger
+
+from database.controller import CHANGES_CHANNEL, DbController, bump_data_version
+from utils.config import DataBaseConfig
+
+
+def _notifying_tables() -> set[str]:
+    tables = set()
+    pending = list(DbController.__subclasses__())
+    while pending:
+        model = pending.pop()
+        pending.extend(model.__subclasses__())
+        if model.notify_changes:
+            tables.add(model.__tablename__)
+    return tables
+
+
+class ChangeListener:
+    """
+    Listens to the table change notifications of other bot processes and bumps
+    the data versions of the changed tables, so caches keyed by them are refreshed
+    """
+
+    def __init__(self, config: DataBaseConfig, reconnect_delay: float = 5):
+        self.config = config
+        self.reconnect_delay = reconnect_delay
+
+    @staticmethod
+    def _on_notification(_connection, _pid, _channel, table: str) -> None:
+        bump_data_version(table)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                connection = await asyncpg.connect(self.config.uri('postgresql'))
+            except Exception as e:
+                logger.warning(f'Change listener can not connect: {e}')
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            try:
+                await connection.add_listener(CHANGES_CHANNEL, self._on_notification)
+                # Notifications sent while disconnected are lost
+                for table in _notifying_tables():
+                    bump_data_version(table)
+                logger.info(f'Listening to {CHANGES_CHANNEL}')
+                await closed.wait()
+                logger.warning('Change listener connection is lost')
+            finally:
+                await connection.close()
+            await asyncio.sleep(self.reconnect_delay)
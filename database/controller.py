@@ -1,24 +1,71 @@
+import collections
+import functools
+from dataclasses import dataclass
 from typing import Optional, Callable, Union, Type, Any
 
 from loguru import logger
-from sqlalchemy import delete, text
+from sqlalchemy import delete, func, text, update
 from sqlalchemy.engine import CursorResult
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.future import select
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql.elements import BinaryExpression, BooleanClauseList
 
-from database.db_core import Session, Base, Engine
+from database.db_core import Base, after_commit, session_scope
+from utils.config import get_config
+
+# Channel of the Postgres notifications about changed tables, the payload is the table name
+CHANGES_CHANNEL = 'data_changed'
+
+# Bumped after every committed write through DbController, keyed by table name
+_data_versions: collections.Counter[str] = collections.Counter()
+
+
+def bump_data_version(table: str) -> None:
+    _data_versions[table] += 1
+
+
+@dataclass
+class Page:
+    """
+    One page of a keyset listing
+    next_key/prev_key are passed back as `after`/`before` to fetch the neighbour page, None if there is none
+    """
+    items: list
+    next_key: int | None = None
+    prev_key: int | None = None
 
 
 class DbController:
     """
     Main parent class for all DB models
     Implements CRUD methods
+    All methods join the current unit of work if there is one
     """
 
+    # Tell other bot processes about committed writes, see `db.notify_changes`
+    notify_changes: bool = False
+
     def __init__(self, **kwargs):
         pass
 
+    @classmethod
+    def data_version(cls) -> int:
+        """Changes whenever a write to the table of the class is committed"""
+        return _data_versions[cls.__tablename__]
+
+    @classmethod
+    def _data_changed(cls) -> None:
+        after_commit(functools.partial(bump_data_version, cls.__tablename__))
+
+    @classmethod
+    async def _notify_changed(cls, session) -> None:
+        """Postgres delivers the notification only if the transaction commits"""
+        if cls.notify_changes and get_config().db.notify_changes:
+            await session.execute(
+                select(func.pg_notify(CHANGES_CHANNEL, cls.__tablename__)),
+            )
+
     def as_dict(self):
         """
         Returns sqlalchemy object as a dict
@@ -52,21 +99,23 @@ class DbController:
             cls,
             field: Optional[str] = None,
             custom_filter: BinaryExpression | BooleanClauseList | bool | None = None,
+            order_by: Optional[Any] = None,
             **kwargs,
     ):
         """
         Get one or None class instance
         :param field: str, if needed to return only one field of instance
         :param custom_filter: to pass custom filer, like cls.iid.in_([1,2,3])
+        :param order_by: which of the matching instances comes first, any of them without it
         :param kwargs: fields for apply filters to request, like iid=1
         :return: instance of class, None or one field of class
         """
-        async with Session() as session:
-            async with session.begin():
-                request = await session.execute(
-                    cls._make_query(select, field, custom_filter, **kwargs),
-                )
-                return request.scalars().first()
+        query = cls._make_query(select, field, custom_filter, **kwargs)
+        if order_by is not None:
+            query = query.order_by(order_by)
+        async with session_scope() as session:
+            request = await session.execute(query)
+            return request.scalars().first()
 
     @classmethod
     async def get_list(
@@ -77,6 +126,7 @@ class DbController:
             limit: Optional[int] = None,
             custom_field: Optional[Any] = None,
             group_by: tuple[Any, ...] = (),
+            options: tuple[Any, ...] = (),
             **kwargs,
     ) -> list:
         """
@@ -87,23 +137,79 @@ class DbController:
         :param limit: limit results
         :param custom_field: custom fields or function needed to be passed to cls._make_query
         :param group_by: group_by results
+        :param options: loader options, like joinedload(cls.relation)
         :param kwargs: fields for apply filters to request, like iid=1
         :return: list of instances
         """
-        session = Session()
-        async with session.begin():
-            try:
-                query = cls._make_query(select, field, custom_filter, custom_field, **kwargs)
-                if order_by is not None:
-                    query = query.order_by(order_by)
-                if limit is not None:
-                    query = query.limit(limit)
-                if group_by:
-                    query = query.group_by(*group_by)
-                request = await session.execute(query)
-                return request.scalars().all()
-            except Exception as e:
-                logger.exception(e)
+        query = cls._make_query(select, field, custom_filter, custom_field, **kwargs)
+        if order_by is not None:
+            query = query.order_by(order_by)
+        if limit is not None:
+            query = query.limit(limit)
+        if group_by:
+            query = query.group_by(*group_by)
+        if options:
+            query = query.options(*options)
+        async with session_scope() as session:
+            request = await session.execute(query)
+            return request.scalars().unique().all()
+
+    @classmethod
+    async def get_page(
+            cls,
+            limit: int,
+            after: int | None = None,
+            before: int | None = None,
+            descending: bool = False,
+            custom_filter: BinaryExpression | BooleanClauseList | bool | None = None,
+            options: tuple[Any, ...] = (),
+            **kwargs,
+    ) -> Page:
+        """
+        Get one page of class instances ordered by id, seeking from the given key instead of using OFFSET
+        :param limit: page size
+        :param after: id of the last row of the previous page, to move forward
+        :param before: id of the first row of the next page, to move backward
+        :param descending: newest rows first
+        :param custom_filter: to pass custom filer, like cls.iid.in_([1,2,3])
+        :param options: loader options, like joinedload(cls.relation)
+        :param kwargs: fields for apply filters to request, like iid=1
+        :return: Page
+        """
+        key = cls.__dict__['id']
+        backward = before is not None
+        # Walking backward reads the rows in reverse order and flips them afterwards
+        ascending = descending == backward
+        query = cls._make_query(select, None, custom_filter, **kwargs)
+        if backward:
+            query = query.where(key > before if descending else key < before)
+        elif after is not None:
+            query = query.where(key < after if descending else key > after)
+        query = query.order_by(key.asc() if ascending else key.desc()).limit(limit + 1)
+        if options:
+            query = query.options(*options)
+
+        async with session_scope() as session:
+            request = await session.execute(query)
+            items = request.scalars().unique().all()
+
+        has_more = len(items) > limit
+        items = items[:limit]
+        if backward:
+            items.reverse()
+        if not items:
+            return Page(items=items)
+        if backward:
+            return Page(
+                items=items,
+                next_key=items[-1].id,
+                prev_key=items[0].id if has_more else None,
+            )
+        return Page(
+            items=items,
+            next_key=items[-1].id if has_more else None,
+            prev_key=items[0].id if after is not None else None,
+        )
 
     @classmethod
     async def get_all(cls, field: Optional[str] = None):
@@ -112,13 +218,12 @@ class DbController:
         :param field: str, if needed to return only one field of instance
         :return: list of all instances of model
         """
-        async with Session() as session:
-            async with session.begin():
-                if field is not None:
-                    request = await session.execute(select(cls.__dict__[field]))
-                else:
-                    request = await session.execute(select(cls))
-                return request.scalars().all()
+        async with session_scope() as session:
+            if field is not None:
+                request = await session.execute(select(cls.__dict__[field]))
+            else:
+                request = await session.execute(select(cls))
+            return request.scalars().all()
 
     @classmethod
     async def create(cls, **kwargs):
@@ -127,39 +232,48 @@ class DbController:
         :param kwargs: class attributes
         :return: new instance of class or None
         """
-        async with Session() as session:
-            async with session.begin():
-                try:
-                    new_instance = cls(**kwargs)
-                    session.add(new_instance)
-                    await session.commit()
-                    return new_instance
-                except IntegrityError as exp:
-                    logger.warning(exp)
-                    await session.rollback()
-                    return str(exp)
+        try:
+            async with session_scope(savepoint=True) as session:
+                new_instance = cls(**kwargs)
+                session.add(new_instance)
+                await session.flush()
+                await cls._notify_changed(session)
+        except IntegrityError as exp:
+            logger.warning(exp)
+            return str(exp)
+        cls._data_changed()
+        return new_instance
 
     async def update(
         self,
         **kwargs,
     ):
         """
-        Update instance fields
+        Update instance fields with a single UPDATE by primary key
+        The instance is not attached to the session, so detached copies can be updated safely
         :param kwargs: fields needed to update and new values
         :return: new instance of class or None
         """
-        for k, v in kwargs.items():
-            if k in self.__dict__.keys():
-                self.__setattr__(k, v)
-        async with Session() as session:
-            async with session.begin():
-                try:
-                    session.add(self)
-                    await session.commit()
-                    return self
-                except IntegrityError as exp:
-                    logger.warning(exp)
-                    await session.rollback()
+        values = {k: v for k, v in kwargs.items() if k in self.__dict__.keys()}
+        cls = self.__class__
+        try:
+            async with session_scope(savepoint=True) as session:
+                if values:
+                    await session.execute(
+                        update(cls)
+                        .where(cls.__dict__['id'] == self.__dict__['id'])
+                        .values(**values)
+                        .execution_options(synchronize_session=False),
+                    )
+                    await cls._notify_changed(session)
+        except IntegrityError as exp:
+            logger.warning(exp)
+            return
+
+        for k, v in values.items():
+            set_committed_value(self, k, v)
+        cls._data_changed()
+        return self
 
     @classmethod
     async def commit_changes(cls, instances: list[Type[Base]]) -> Optional[list[Type[Base]]]:
@@ -168,16 +282,19 @@ class DbController:
         :param instances: any ORM initialised instances
         :return: instances or None
         """
-        async with Session() as session:
-            async with session.begin():
+        try:
+            async with session_scope(savepoint=True) as session:
                 for instance in instances:
                     session.add(instance)
-                try:
-                    await session.commit()
-                    return instances
-                except IntegrityError as exp:
-                    logger.warning(exp)
-                    await session.rollback()
+                await session.flush()
+                for model in {type(instance) for instance in instances}:
+                    await model._notify_changed(session)
+        except IntegrityError as exp:
+            logger.warning(exp)
+            return
+        for model in {type(instance) for instance in instances}:
+            model._data_changed()
+        return instances
 
     @classmethod
     async def remove(
@@ -189,16 +306,15 @@ class DbController:
         :param custom_filter: where expression
         :return: bool, True if there's no error
         """
-        async with Session() as session:
-            async with session.begin():
-                try:
-                    await session.execute(delete(cls).where(custom_filter))
-                    await session.commit()
-                    return True
-                except Exception as e:
-                    logger.exception(e)
-                    await session.rollback()
-                    return False
+        try:
+            async with session_scope(savepoint=True) as session:
+                await session.execute(delete(cls).where(custom_filter))
+                await cls._notify_changed(session)
+        except Exception as e:
+            logger.exception(e)
+            return False
+        cls._data_changed()
+        return True
 
     @classmethod
     async def execute_query(
@@ -211,11 +327,10 @@ class DbController:
         :param query: str, SQL query
         :return: Any
         """
-        connection = Engine.connect()
         try:
-            # without connection.begin it won't commit changes and will applies rollback
-            async with connection.begin():
-                return await connection.execute(text(query), kwargs)
+            async with session_scope(savepoint=True) as session:
+                # AsyncSession returns a buffered result, so it stays readable after close
+                return await session.execute(text(query), kwargs)
         except Exception as e:
             logger.exception(f'Exception has been occurred {e}')
             raise
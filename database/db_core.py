@@ -1,10 +1,124 @@
+import contextlib
+from contextvars import ContextVar, Token
+from typing import AsyncIterator, Callable, Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from database.leak_tracker import LeakTracker
+from database.pool_stats import MonitoredQueuePool, PoolMonitor, PoolStats
 from utils.config import get_config
 
 Base = declarative_base()
-Engine = create_async_engine(get_config().db.uri())
-Session = sessionmaker(Engine, expire_on_commit=False, class_=AsyncSession)
\ No newline at end of file
+Engine = create_async_engine(
+    get_config().db.uri(),
+    poolclass=MonitoredQueuePool,
+    **get_config().db.engine_options(),
+)
+Session = sessionmaker(Engine, expire_on_commit=False, class_=AsyncSession)
+pool_monitor = PoolMonitor(Engine)
+leak_tracker = LeakTracker(Engine, get_config().db.leak_threshold) if get_config().db.leak_detection else None
+
+
+def get_pool_stats() -> PoolStats:
+    return pool_monitor.snapshot()
+
+
+class UnitOfWork:
+    """
+    One session and transaction shared by every DbController call made while it is open
+    Committed once on close unless marked as failed
+    """
+
+    def __init__(self):
+        self.session: AsyncSession = Session()
+        self.failed = False
+        self.after_commit: list[Callable[[], None]] = []
+        self._token: Optional[Token] = None
+
+    @staticmethod
+    def current() -> Optional['UnitOfWork']:
+        return current_unit_of_work.get()
+
+    def open(self) -> 'UnitOfWork':
+        self._token = current_unit_of_work.set(self)
+        return self
+
+    async def close(self) -> None:
+        current_unit_of_work.reset(self._token)
+        try:
+            if self.failed:
+                await self.session.rollback()
+                return
+            await self.session.commit()
+        finally:
+            await self.session.close()
+
+        for callback in self.after_commit:
+            callback()
+
+
+current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar('current_unit_of_work', default=None)
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """Runs callback once the current unit of work is committed, or right away without one"""
+    uow = UnitOfWork.current()
+    if uow is None:
+        callback()
+    else:
+        uow.after_commit.append(callback)
+
+
+@contextlib.asynccontextmanager
+async def unit_of_work() -> AsyncIterator[UnitOfWork]:
+    """Joins the current unit of work or opens a new one for the block"""
+    uow = UnitOfWork.current()
+    if uow is not None:
+        yield uow
+        return
+
+    uow = UnitOfWork().open()
+    try:
+        yield uow
+    except BaseException:
+        uow.failed = True
+        raise
+    finally:
+        await uow.close()
+
+
+@contextlib.asynccontextmanager
+async def outside_unit_of_work() -> AsyncIterator[None]:
+    """
+    DbController calls in the block commit on their own even if a unit of work is open
+    For writes which must be committed before a side effect outside the database, like an RPC
+    """
+    token = current_unit_of_work.set(None)
+    try:
+        yield
+    finally:
+        current_unit_of_work.reset(token)
+
+
+@contextlib.asynccontextmanager
+async def session_scope(savepoint: bool = False) -> AsyncIterator[AsyncSession]:
+    """
+    Session of the current unit of work or a new short-lived session and transaction
+    :param savepoint: wrap the block in SAVEPOINT when joining, so its failure
+        does not abort the whole unit of work
+    """
+    uow = UnitOfWork.current()
+    if uow is None:
+        async with Session() as session:
+            async with session.begin():
+                yield session
+        return
+
+    if savepoint:
+        async with uow.session.begin_nested():
+            yield uow.session
+    else:
+        yield uow.session
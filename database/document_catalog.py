@@ -0,0 +1,78 @@
+import asyncio
+
+from database.models import Document
+
+
+class DocumentCatalog:
+    """
+    Process-local copy of the documents table keyed by id and by name
+    Reloaded as a whole once the data version of the table changes,
+    documents missing from the copy are read through
+    Callers get detached copies, so changing one does not change the catalog,
+    a document is read again by id before it is written
+    """
+
+    def __init__(self):
+        self._by_id: dict[int, Document] = {}
+        self._by_name: dict[str, Document] = {}
+        self._version: int | None = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    async def _sync(self) -> None:
+        if self._version == Document.data_version():
+            return
+        async with self._lock:
+            # Taken before reading, a write committed meanwhile triggers one more reload
+            version = Document.data_version()
+            if self._version == version:
+                return
+            documents: list[Document] = await Document.get_all()
+            self._by_id = {}
+            self._by_name = {}
+            for document in documents:
+                self._store(document)
+            self._version = version
+            self.reloads += 1
+
+    def _store(self, document: Document) -> None:
+        self._by_id[document.id] = document
+        self._by_name[document.name] = document
+
+    @staticmethod
+    def _copy(document: Document | None) -> Document | None:
+        return Document(**document.as_dict()) if document is not None else None
+
+    async def get(self, document_id: int) -> Document | None:
+        await self._sync()
+        document = self._by_id.get(document_id)
+        if document is not None:
+            self.hits += 1
+            return self._copy(document)
+
+        self.misses += 1
+        document = await Document.get(id=document_id)
+        if document is not None:
+            self._store(document)
+        return self._copy(document)
+
+    async def get_by_name(self, name: str) -> Document | None:
+        await self._sync()
+        document = self._by_name.get(name)
+        if document is not None:
+            self.hits += 1
+            return self._copy(document)
+
+        self.misses += 1
+        document = await Document.get(name=name)
+        if document is not None:
+            self._store(document)
+        return self._copy(document)
+
+    def stats(self) -> str:
+        return f'Документы: {len(self._by_id)} в кэше, hits={self.hits} misses={self.misses} reloads={self.reloads}'
+
+
+document_catalog = DocumentCatalog()
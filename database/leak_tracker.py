@@ -0,0 +1,81 @@
+import asyncio
+import dataclasses
+import sys
+import time
+import traceback
+from types import FrameType
+
+import greenlet
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from utils.config import get_config
+
+
+@dataclasses.dataclass
+class CheckedOutConnection:
+    checked_out_at: float
+    call_site: list[str]
+
+    @property
+    def held_for(self) -> float:
+        return time.monotonic() - self.checked_out_at
+
+
+def _caller_frame() -> FrameType:
+    # Pool events of the async engine are fired inside a greenlet spawned by
+    # sqlalchemy, the awaiting coroutine stack lives in the parent greenlet
+    parent = greenlet.getcurrent().parent
+    if parent is not None and parent.gr_frame is not None:
+        return parent.gr_frame
+    return sys._getframe(1)
+
+
+def _call_site(frame: FrameType) -> list[str]:
+    project_dir = str(get_config().project_dir)
+    return [
+        f'{item.filename}:{item.lineno} in {item.name}'
+        for item in traceback.extract_stack(frame)
+        if item.filename.startswith(project_dir) and 'site-packages' not in item.filename
+    ]
+
+
+class LeakTracker:
+    """
+    Debug helper which remembers where every pool connection was checked out
+    and reports connections held longer than the threshold
+    """
+
+    def __init__(self, engine: AsyncEngine, threshold: float):
+        self.threshold = threshold
+        self.checked_out: dict[int, CheckedOutConnection] = {}
+
+        pool = engine.sync_engine.pool
+        event.listen(pool, 'checkout', self._on_checkout)
+        event.listen(pool, 'checkin', self._on_checkin)
+
+    def _on_checkout(self, _dbapi_connection, connection_record, _connection_proxy):
+        self.checked_out[id(connection_record)] = CheckedOutConnection(
+            checked_out_at=time.monotonic(),
+            call_site=_call_site(_caller_frame()),
+        )
+
+    def _on_checkin(self, _dbapi_connection, connection_record):
+        self.checked_out.pop(id(connection_record), None)
+
+    def find_leaks(self) -> list[CheckedOutConnection]:
+        return [item for item in self.checked_out.values() if item.held_for > self.threshold]
+
+    def report(self) -> int:
+        leaks = self.find_leaks()
+        for leak in leaks:
+            logger.warning(
+                f'DB connection held for {leak.held_for:.1f}s, checked out at:\n' + '\n'.join(leak.call_site),
+            )
+        return len(leaks)
+
+    async def run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.report()
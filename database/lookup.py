@@ -0,0 +1,41 @@
+from types import MappingProxyType
+from typing import Mapping
+
+import sqlalchemy as sa
+
+from database.db_core import session_scope
+
+
+class LookupTable:
+    """Frozen bidirectional id <-> name map of a reference table"""
+
+    def __init__(self, names: Mapping[int, str]):
+        self.by_id: Mapping[int, str] = MappingProxyType(dict(names))
+        self.by_name: Mapping[str, int] = MappingProxyType({name: id_ for id_, name in names.items()})
+        if len(self.by_name) != len(self.by_id):
+            raise ValueError(f'Names are not unique: {dict(names)}')
+
+    def name(self, id_: int) -> str | None:
+        return self.by_id.get(id_)
+
+    def id(self, name: str) -> int | None:
+        return self.by_name.get(name)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, LookupTable) and dict(self.by_id) == dict(other.by_id)
+
+    def __repr__(self) -> str:
+        return f'LookupTable({dict(self.by_id)})'
+
+
+async def load_lookup(table: sa.Table, expected: LookupTable) -> LookupTable:
+    """
+    Reads an `id, name` reference table and checks it matches the constants of the code
+    :raise RuntimeError: if the table differs
+    """
+    async with session_scope() as session:
+        request = await session.execute(sa.select(table.c.id, table.c.name))
+        loaded = LookupTable(dict(request.all()))
+    if loaded != expected:
+        raise RuntimeError(f'{table.name} does not match the code: {loaded} in DB, {expected} expected')
+    return loaded
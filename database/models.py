@@ -1,12 +1,19 @@
+import asyncio
 from datetime import datetime
-from typing import Optional
+from types import MappingProxyType
+from typing import Mapping, Optional
 
 import sqlalchemy as sa
-
-from database.aiogram_storage import get_channel
-from database.controller import DbController
-from database.db_core import Base
-from utils.rabbit import queue_push
+import ujson
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import aliased, joinedload, relationship
+
+from database.controller import DbController, Page
+from database.db_core import Base, session_scope, after_commit, unit_of_work
+from database.lookup import LookupTable, load_lookup
+from utils.cache import TTLCache
+from utils.config import get_config
+from utils.rabbit import PUSH_ROUTING_KEY
 from utils.types import (
     IntColumnType,
     StrColumnType,
@@ -14,6 +21,11 @@ from utils.types import (
     DateTimeColumnType,
 )
 
+# Orders listed in one status change notification, the rest are counted
+STATUS_NOTIFICATION_MAX_ORDERS = 30
+# Statements Order.create_or_get_active runs before giving up on concurrent writes to the same order
+CREATE_ATTEMPTS = 3
+
 
 class UserRole(Base, DbController):
     __tablename__ = 'user_roles'
@@ -21,26 +33,42 @@ class UserRole(Base, DbController):
     ACCOUNTANT = 1
     WORKER = 2
 
+    # Rows of the table, checked by `load_lookup_tables` at startup
+    codes = LookupTable({
+        ACCOUNTANT: 'accountant',
+        WORKER: 'worker',
+    })
+    labels = LookupTable({
+        WORKER: "👷‍Сотрудник",
+        ACCOUNTANT: "🧑‍💻Бухгалтер",
+    })
+
     id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
     name: StrColumnType = sa.Column(sa.String, nullable=False, unique=True)
 
     @staticmethod
     def get_id_by_str(role: str) -> int | None:
-        return {
-            "👷‍Сотрудник": UserRole.WORKER,
-            "🧑‍💻Бухгалтер": UserRole.ACCOUNTANT,
-        }.get(role)
+        return UserRole.labels.id(role)
 
     @staticmethod
     def get_str_by_id(role_id: int) -> str | None:
-        return {
-            UserRole.WORKER: "👷‍Сотрудник",
-            UserRole.ACCOUNTANT: "🧑‍💻Бухгалтер",
-        }.get(role_id)
+        return UserRole.labels.name(role_id)
+
+
+# Entries keep the data version of the users table they were read at and are stale once it changes,
+# so writes of this process are seen once committed, writes of others with `db.notify_changes`
+_users_by_telegram_id: TTLCache[int, tuple[int, 'User']] = TTLCache(
+    ttl=get_config().cache.user_ttl,
+    max_size=get_config().cache.user_max_size,
+)
 
 
 class User(Base, DbController):
     __tablename__ = 'users'
+    __table_args__ = (
+        sa.Index('ix_users_active_role_id', 'role_id', postgresql_where=sa.text('NOT is_deleted')),
+    )
+    notify_changes = True
 
     id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
     telegram_id: IntColumnType = sa.Column(sa.Integer(), nullable=False, unique=True)
@@ -50,11 +78,23 @@ class User(Base, DbController):
 
     @staticmethod
     async def get_by_telegram_id(telegram_user_id: int) -> Optional['User']:
-        return await User.get(telegram_id=telegram_user_id, is_deleted=False)
+        # Taken before reading, a write committed meanwhile leaves the entry stale
+        version = User.data_version()
+        cached = _users_by_telegram_id.get(telegram_user_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        user = await User.get(telegram_id=telegram_user_id, is_deleted=False)
+        if user is not None:
+            _users_by_telegram_id.set(telegram_user_id, (version, user))
+        return user
 
 
 class Invitation(Base, DbController):
     __tablename__ = 'invitations'
+    __table_args__ = (
+        sa.Index('ix_invitations_token', 'token'),
+    )
+    notify_changes = True
 
     id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
     username: StrColumnType = sa.Column(sa.String(), nullable=False)
@@ -68,6 +108,7 @@ class Invitation(Base, DbController):
 
 class Document(Base, DbController):
     __tablename__ = 'documents'
+    notify_changes = True
 
     id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
     name: StrColumnType = sa.Column(sa.String(), nullable=False, unique=True)
@@ -83,32 +124,143 @@ class OrderStatus(Base, DbController):
     DONE = 4
     DECLINED = 5
 
+    # Rows of the table, checked by `load_lookup_tables` at startup
+    names = LookupTable({
+        NEW: 'Новая',
+        PROCESSING: 'Обрабатывается',
+        READY: 'Готова к выдачи',
+        DONE: 'Выполнена',
+        DECLINED: 'Отменена',
+    })
+    # Names typed in commands, like /bulk_status
+    short_names = LookupTable({
+        NEW: 'new',
+        PROCESSING: 'processing',
+        READY: 'ready',
+        DONE: 'done',
+        DECLINED: 'declined',
+    })
+    # Statuses an order may be moved to from each status, done and declined orders are final
+    transitions: Mapping[int, frozenset[int]] = MappingProxyType({
+        NEW: frozenset({PROCESSING, READY, DECLINED}),
+        PROCESSING: frozenset({READY, DECLINED}),
+        READY: frozenset({PROCESSING, DONE, DECLINED}),
+        DONE: frozenset(),
+        DECLINED: frozenset(),
+    })
+
     id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
     name: StrColumnType = sa.Column(sa.String, nullable=False, unique=True)
 
     @staticmethod
     def get_str_by_id(order_id: int) -> str | None:
-        return {
-            1: 'Новая',
-            2: 'Обрабатывается',
-            3: 'Готова к выдачи',
-            4: 'Выполнена',
-            5: 'Отменена',
-        }.get(order_id)
+        return OrderStatus.names.name(order_id)
 
     @staticmethod
     def get_id_by_str(order: str) -> int | None:
-        return {
-            'Новая': 1,
-            'Обрабатывается': 2,
-            'Готова к выдачи': 3,
-            'Выполнена': 4,
-            'Отменена': 5,
-        }.get(order)
+        return OrderStatus.names.id(order)
+
+    @staticmethod
+    def can_transition(from_status_id: int, to_status_id: int) -> bool:
+        return to_status_id in OrderStatus.transitions.get(from_status_id, ())
+
+
+class NotificationOutbox(Base, DbController):
+    """
+    Messages waiting to be published to RabbitMQ
+    Written in the same transaction as the change they notify about, see database.outbox
+    """
+    __tablename__ = 'notification_outbox'
+
+    id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
+    routing_key: StrColumnType = sa.Column(sa.String(), nullable=False)
+    payload: StrColumnType = sa.Column(sa.Text(), nullable=False)
+    created_at: DateTimeColumnType = sa.Column(sa.DateTime(), default=datetime.now, nullable=False)
+    attempts: IntColumnType = sa.Column(sa.Integer(), default=0, nullable=False)
+    next_attempt_at: DateTimeColumnType = sa.Column(sa.DateTime(), default=datetime.now, nullable=False, index=True)
+    # When a relay took the row for publishing, None if nobody has
+    claimed_at: DateTimeColumnType = sa.Column(sa.DateTime(), nullable=True)
+
+    written = asyncio.Event()
+
+    @staticmethod
+    async def push(message: str, telegram_user_id: int) -> None:
+        await NotificationOutbox.push_many([(message, telegram_user_id)])
+
+    @staticmethod
+    async def push_many(notifications: list[tuple[str, int]]) -> None:
+        """
+        :param notifications: (message, telegram_user_id) pairs, inserted with one statement
+        """
+        if not notifications:
+            return
+        now = datetime.now()
+        async with session_scope() as session:
+            await session.execute(
+                NotificationOutbox.__table__.insert(),
+                [
+                    dict(
+                        routing_key=PUSH_ROUTING_KEY,
+                        payload=ujson.dumps(dict(message=message, telegram_user_id=telegram_user_id)),
+                        created_at=now,
+                        attempts=0,
+                        next_attempt_at=now,
+                    )
+                    for message, telegram_user_id in notifications
+                ],
+            )
+        after_commit(NotificationOutbox.written.set)
+
+
+class ProcessedUpdate(Base, DbController):
+    """
+    Ids of Telegram updates accepted by any replica of the bot, see bot.sdk.webhook
+    Kept for `webhook.dedup_window` seconds to recognize redelivered updates
+    """
+    __tablename__ = 'processed_updates'
+
+    update_id: IntColumnType = sa.Column(sa.BigInteger(), primary_key=True, autoincrement=False)
+    received_at: DateTimeColumnType = sa.Column(sa.DateTime(), default=datetime.now, nullable=False, index=True)
+
+    @classmethod
+    async def claim(cls, update_id: int) -> bool:
+        """
+        :return: False if the update was already claimed
+        """
+        async with session_scope() as session:
+            request = await session.execute(
+                postgresql.insert(cls)
+                .values(update_id=update_id, received_at=datetime.now())
+                .on_conflict_do_nothing()
+                .returning(cls.update_id),
+            )
+            return request.scalar() is not None
+
+    @classmethod
+    async def release(cls, update_id: int) -> None:
+        async with session_scope() as session:
+            await session.execute(sa.delete(cls).where(cls.update_id == update_id))
+
+    @classmethod
+    async def prune(cls, received_before: datetime) -> int:
+        async with session_scope() as session:
+            request = await session.execute(sa.delete(cls).where(cls.received_at < received_before))
+            return request.rowcount
 
 
 class Order(Base, DbController):
     __tablename__ = 'orders'
+    __table_args__ = (
+        sa.Index('ix_orders_sender_id_status_id', 'sender_id', 'status_id'),
+        sa.Index('ix_orders_receiver_id_status_id', 'receiver_id', 'status_id'),
+        sa.Index('ix_orders_document_id_status_id', 'document_id', 'status_id'),
+        sa.Index(
+            'ix_orders_active_document_id', 'document_id', 'receiver_id', 'sender_id',
+            unique=True,
+            postgresql_where=sa.text('status_id NOT IN (4, 5)'),
+        ),
+    )
+    notify_changes = True
 
     id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
     document_id: IntColumnType = sa.Column(sa.Integer(), sa.ForeignKey(Document.id), nullable=False)
@@ -118,90 +270,348 @@ class Order(Base, DbController):
     created_at: DateTimeColumnType = sa.Column(sa.DateTime(), default=datetime.now, nullable=False)
     status_changed_at: DateTimeColumnType = sa.Column(sa.DateTime())
 
+    document: Document = relationship(Document, lazy='raise')
+    sender: User = relationship(User, foreign_keys=[sender_id], lazy='raise')
+    receiver: User = relationship(User, foreign_keys=[receiver_id], lazy='raise')
+
+    @staticmethod
+    def _related_options(with_related: bool) -> tuple:
+        if not with_related:
+            return ()
+        return (
+            joinedload(Order.document),
+            joinedload(Order.sender),
+            joinedload(Order.receiver),
+        )
+
     @staticmethod
-    async def create_with_push(
+    def active_filter() -> sa.sql.ColumnElement:
+        """Statuses are inlined into SQL, so the planner can match partial indexes on active orders"""
+        return Order.status_id.notin_(sa.bindparam(
+            'inactive_statuses',
+            (OrderStatus.DONE, OrderStatus.DECLINED),
+            expanding=True,
+            literal_execute=True,
+        ))
+
+    @classmethod
+    async def create_or_get_active(
+            cls,
             sender_id: int,
             receiver_id: int,
             document_id: int,
-    ) -> 'Order':
-        sender: User = await User.get(id=sender_id)
-        order: Order = await Order.create(
-            sender_id=sender_id,
-            document_id=document_id,
-            receiver_id=receiver_id,
-            status_id=OrderStatus.NEW,
+    ) -> tuple['Order', bool]:
+        """
+        Creates an order unless the same one is already active, the sender is notified about a new order
+        A single INSERT ... ON CONFLICT DO NOTHING returns either the inserted or the existing order,
+        the unique index on active orders keeps concurrent requests from creating duplicates
+        :return: the order and whether it was created
+        :raise RuntimeError: if concurrent writes kept the order from being created or found
+        """
+        active = sa.and_(
+            cls.document_id == document_id,
+            cls.receiver_id == receiver_id,
+            cls.sender_id == sender_id,
+            cls.active_filter(),
+        )
+        inserted = (
+            postgresql.insert(cls)
+            .values(
+                document_id=document_id,
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                status_id=OrderStatus.NEW,
+                created_at=datetime.now(),
+            )
+            .on_conflict_do_nothing(
+                index_elements=[cls.document_id, cls.receiver_id, cls.sender_id],
+                index_where=cls.active_filter(),
+            )
+            .returning(*cls.__table__.columns)
+            .cte('inserted')
         )
-        channel = get_channel()
-        await queue_push(
-            channel,
-            f"У вас запросили документ. Посмотреть заявку можно нажав на\n/order_{order.id}",
-            telegram_user_id=sender.telegram_id,
+        result = sa.union_all(
+            sa.select(inserted, sa.true().label('created')),
+            sa.select(*cls.__table__.columns, sa.false().label('created'))
+            .where(active, ~sa.exists(sa.select(inserted.c.id))),
+        ).subquery()
+        statement = sa.select(aliased(cls, result), result.c.created)
+
+        async with unit_of_work():
+            async with session_scope() as session:
+                for _ in range(CREATE_ATTEMPTS):
+                    row = (await session.execute(statement)).first()
+                    # None if the conflicting order was committed after the statement had started,
+                    # so it was not visible to its snapshot, or was completed meanwhile
+                    if row is not None:
+                        break
+                else:
+                    raise RuntimeError(
+                        f'Active order of document {document_id} from {sender_id} to {receiver_id} '
+                        f'is neither created nor found in {CREATE_ATTEMPTS} attempts'
+                    )
+                order, created = row
+                if created:
+                    await cls._notify_changed(session)
+            if created:
+                cls._data_changed()
+                sender: User = await User.get(id=sender_id)
+                await NotificationOutbox.push(
+                    f"У вас запросили документ. Посмотреть заявку можно нажав на\n/order_{order.id}",
+                    telegram_user_id=sender.telegram_id,
+                )
+        return order, created
+
+    @staticmethod
+    async def get_all_not_completed_order(user_id: int, with_related: bool = False) -> list['Order']:
+        order = await Order.get_list(
+            custom_filter=sa.and_(
+                sa.or_(
+                    Order.receiver_id == user_id,
+                    Order.sender_id == user_id
+                ),
+                Order.active_filter(),
+            ),
+            options=Order._related_options(with_related),
         )
         return order
 
     @staticmethod
-    async def get_not_completed_order(
-            document_id: int,
+    async def get_list_for_view(
+            statuses: tuple[int, ...] | None = None,
             receiver_id: int | None = None,
             sender_id: int | None = None,
-    ) -> Optional['Order']:
-        order = await Order.get(custom_filter=sa.and_(
-            Order.document_id == document_id,
-            Order.receiver_id == receiver_id if receiver_id else True,
-            Order.sender_id == sender_id if sender_id else True,
-            ~Order.status_id.in_((OrderStatus.DONE, OrderStatus.DECLINED)),
-        ))
-        return order
+            document_id: int | None = None,
+            with_related: bool = False,
+    ) -> list['Order']:
+        """
+        :param with_related: load document, sender and receiver in the same query
+        """
+        return await Order.get_list(
+            custom_filter=Order._view_filter(statuses, receiver_id, sender_id, document_id),
+            options=Order._related_options(with_related),
+        )
 
     @staticmethod
-    async def get_all_not_completed_order(user_id: int) -> list['Order']:
-        order = await Order.get_list(custom_filter=sa.and_(
-            sa.or_(
-                Order.receiver_id == user_id,
-                Order.sender_id == user_id
-            ),
-            ~Order.status_id.in_((OrderStatus.DONE, OrderStatus.DECLINED)),
-        ))
-        return order
+    async def get_page_for_view(
+            limit: int,
+            after: int | None = None,
+            before: int | None = None,
+            statuses: tuple[int, ...] | None = None,
+            receiver_id: int | None = None,
+            sender_id: int | None = None,
+            with_related: bool = False,
+    ) -> Page:
+        """
+        Same filters as `get_list_for_view`, one page at a time, newest orders first
+        """
+        return await Order.get_page(
+            limit=limit,
+            after=after,
+            before=before,
+            descending=True,
+            custom_filter=Order._view_filter(statuses, receiver_id, sender_id),
+            options=Order._related_options(with_related),
+        )
 
     @staticmethod
-    async def get_list_for_view(
+    def _view_filter(
             statuses: tuple[int, ...] | None = None,
             receiver_id: int | None = None,
             sender_id: int | None = None,
             document_id: int | None = None,
-    ) -> list['Order']:
-        return await Order.get_list(custom_filter=sa.and_(
+    ):
+        return sa.and_(
             Order.status_id.in_(statuses) if statuses else True,
             Order.receiver_id == receiver_id if receiver_id else True,
             Order.sender_id == sender_id if sender_id else True,
             Order.document_id == document_id if document_id else True,
-        ))
-
-    async def change_status(self, status_id: int):
-        receiver: User = await User.get(id=self.receiver_id)
-        sender: User = await User.get(id=self.sender_id)
-        channel = get_channel()
-        message = f'Статус заявки №{self.id} изменен на {OrderStatus.get_str_by_id(status_id)}'
-        await queue_push(
-            channel,
-            message=message,
-            telegram_user_id=receiver.telegram_id,
-        )
-        await queue_push(
-            channel,
-            message=message,
-            telegram_user_id=sender.telegram_id,
         )
-        await self.update(
-            status_id=status_id,
-            status_changed_at=datetime.now(),
+
+    @classmethod
+    def _change_status_statement(cls, expected_status_id: int, status_id: int, *criteria):
+        """
+        UPDATE of the orders matching the criteria which still have the expected status,
+        returns ids of the changed orders with telegram ids of their senders and receivers
+        """
+        sender = aliased(User)
+        receiver = aliased(User)
+        return (
+            sa.update(cls)
+            .where(
+                *criteria,
+                cls.status_id == expected_status_id,
+                sender.id == cls.sender_id,
+                receiver.id == cls.receiver_id,
+            )
+            .values(status_id=status_id, status_changed_at=datetime.now())
+            .returning(cls.id, sender.telegram_id, receiver.telegram_id)
+            .execution_options(synchronize_session=False)
         )
 
+    @staticmethod
+    def _status_notifications(changed: list[tuple[int, int, int]], status_id: int) -> list[tuple[str, int]]:
+        """
+        One message per user, however many of their orders were changed
+        :param changed: (order_id, sender telegram id, receiver telegram id) rows
+        """
+        orders_by_user: dict[int, list[int]] = {}
+        for order_id, sender_telegram_id, receiver_telegram_id in changed:
+            for telegram_id in (receiver_telegram_id, sender_telegram_id):
+                user_orders = orders_by_user.setdefault(telegram_id, [])
+                if not user_orders or user_orders[-1] != order_id:
+                    user_orders.append(order_id)
+
+        status = OrderStatus.get_str_by_id(status_id)
+        notifications = []
+        for telegram_id, order_ids in orders_by_user.items():
+            if len(order_ids) == 1:
+                message = f'Статус заявки №{order_ids[0]} изменен на {status}'
+            else:
+                listed = ', '.join(f'№{order_id}' for order_id in order_ids[:STATUS_NOTIFICATION_MAX_ORDERS])
+                if len(order_ids) > STATUS_NOTIFICATION_MAX_ORDERS:
+                    listed += f' и еще {len(order_ids) - STATUS_NOTIFICATION_MAX_ORDERS}'
+                message = f'Статус заявок {listed} изменен на {status}'
+            notifications.append((message, telegram_id))
+        return notifications
+
+    @classmethod
+    async def change_status(
+            cls,
+            order_id: int,
+            expected_status_id: int,
+            status_id: int,
+    ) -> tuple[bool, int | None]:
+        """
+        Changes the status with one UPDATE which succeeds only if the order still has the expected status,
+        telegram ids of the sender and the receiver to notify are returned by the same statement
+        :param expected_status_id: status the user saw when choosing the new one
+        :return: whether the status was changed and the current status of the order, None if there is no such order
+        :raise ValueError: if the order status can not be moved to the new one
+        """
+        if not OrderStatus.can_transition(expected_status_id, status_id):
+            raise ValueError(f'Order status can not be changed from {expected_status_id} to {status_id}')
+        async with unit_of_work():
+            async with session_scope() as session:
+                request = await session.execute(
+                    cls._change_status_statement(expected_status_id, status_id, cls.id == order_id),
+                )
+                changed = request.all()
+                if not changed:
+                    request = await session.execute(sa.select(cls.status_id).where(cls.id == order_id))
+                    return False, request.scalar()
+                await cls._notify_changed(session)
+            cls._data_changed()
+            await NotificationOutbox.push_many(cls._status_notifications(changed, status_id))
+        return True, status_id
+
+    @classmethod
+    async def change_status_bulk(
+            cls,
+            expected_status_id: int,
+            status_id: int,
+            order_ids: list[int] | None = None,
+            changed_before: datetime | None = None,
+    ) -> list[int]:
+        """
+        Changes the status of all matching orders with one UPDATE
+        Users get one notification for all their changed orders, written to the outbox with one INSERT
+        :param expected_status_id: only orders with this status are changed
+        :param order_ids: change only these orders
+        :param changed_before: change only orders whose status has not changed since then
+        :return: ids of the changed orders
+        :raise ValueError: if the order status can not be moved to the new one
+        """
+        if not OrderStatus.can_transition(expected_status_id, status_id):
+            raise ValueError(f'Order status can not be changed from {expected_status_id} to {status_id}')
+        criteria = []
+        if order_ids is not None:
+            criteria.append(cls.id.in_(order_ids))
+        if changed_before is not None:
+            criteria.append(sa.func.coalesce(cls.status_changed_at, cls.created_at) < changed_before)
+
+        async with unit_of_work():
+            async with session_scope() as session:
+                request = await session.execute(
+                    cls._change_status_statement(expected_status_id, status_id, *criteria),
+                )
+                changed = request.all()
+                if not changed:
+                    return []
+                await cls._notify_changed(session)
+            cls._data_changed()
+            await NotificationOutbox.push_many(cls._status_notifications(changed, status_id))
+        return [order_id for order_id, _, _ in changed]
+
 
 class Cell(Base, DbController):
     __tablename__ = 'cells'
+    __table_args__ = (
+        sa.Index('ix_cells_order_id', 'order_id'),
+        sa.Index('ix_cells_free', 'id', postgresql_where=sa.text('order_id IS NULL AND is_open')),
+    )
 
     id: IntColumnType = sa.Column(sa.Integer(), primary_key=True)
     order_id: IntColumnType = sa.Column(sa.Integer(), sa.ForeignKey(Order.id))
     is_open: BoolColumnType = sa.Column(sa.Boolean(), nullable=False, default=False)
+
+    @classmethod
+    async def claim_free(cls, order_id: int) -> Optional['Cell']:
+        """
+        Assigns any free cell to the order in a single statement
+        Cells locked by a concurrent claim are skipped, so two senders never get the same cell
+        :param order_id: order to put into the cell
+        :return: claimed cell or None if there are no free cells
+        """
+        free_cell = (
+            sa.select(cls.id)
+            .where(cls.order_id.is_(None), cls.is_open)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        claim = (
+            sa.update(cls)
+            .where(cls.id == free_cell)
+            .values(order_id=order_id, is_open=False)
+            .returning(*cls.__table__.columns)
+        )
+        async with session_scope(savepoint=True) as session:
+            request = await session.execute(
+                sa.select(cls).from_statement(claim).execution_options(populate_existing=True),
+            )
+            return request.scalars().first()
+
+    @classmethod
+    async def get_out_of_service(cls) -> list['Cell']:
+        """Cells taken out of service after the controller failed to open them"""
+        return await cls.get_list(order_id=None, is_open=False, order_by=cls.id)
+
+    @classmethod
+    async def return_to_service(cls, cell_id: int) -> Optional['Cell']:
+        """
+        Puts a cell taken out of service back among the free ones
+        :return: the cell or None if it is not out of service
+        """
+        statement = (
+            sa.update(cls)
+            .where(cls.id == cell_id, cls.order_id.is_(None), sa.not_(cls.is_open))
+            .values(is_open=True)
+            .returning(*cls.__table__.columns)
+        )
+        async with session_scope(savepoint=True) as session:
+            request = await session.execute(
+                sa.select(cls).from_statement(statement).execution_options(populate_existing=True),
+            )
+            return request.scalars().first()
+
+    @classmethod
+    async def get_id_by_order(cls, order_id: int) -> int | None:
+        cell: Cell | None = await cls.get(order_id=order_id)
+        return cell.id if cell else None
+
+
+async def load_lookup_tables() -> None:
+    """Loads the reference tables, fails if they differ from the constants of the models"""
+    UserRole.codes = await load_lookup(UserRole.__table__, UserRole.codes)
+    OrderStatus.names = await load_lookup(OrderStatus.__table__, OrderStatus.names)
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+import ujson
+from loguru import logger
+from sqlalchemy.future import select
+
+from database.db_core import unit_of_work
+from database.models import NotificationOutbox
+from utils.config import OutboxConfig
+from utils.rabbit import RabbitPublisher
+
+
+class OutboxRelay:
+    """
+    Background task publishing `notification_outbox` rows to RabbitMQ
+    A batch of due rows is claimed and committed before publishing, so no lock or transaction
+    is held while waiting for the broker and several replicas can relay at once.
+    Claimed rows are not due until `claim_timeout`, rows of a relay which died meanwhile are claimed again.
+    A row is deleted after the broker confirmed it, failed rows are retried with exponential backoff.
+    """
+
+    def __init__(self, publisher: RabbitPublisher, config: OutboxConfig):
+        self.publisher = publisher
+        self.config = config
+
+    async def _claim(self, now: datetime) -> list[NotificationOutbox]:
+        due = (
+            select(NotificationOutbox.id)
+            .where(NotificationOutbox.next_attempt_at <= now)
+            .order_by(NotificationOutbox.id)
+            .limit(self.config.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with unit_of_work() as uow:
+            rows = await uow.session.execute(
+                sa.update(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(due.scalar_subquery()))
+                .values(claimed_at=now, next_attempt_at=now + timedelta(seconds=self.config.claim_timeout))
+                .returning(NotificationOutbox.id, NotificationOutbox.routing_key, NotificationOutbox.payload)
+                .execution_options(synchronize_session=False),
+            )
+            return sorted(rows.all())
+
+    async def drain_once(self) -> int:
+        """
+        Publishes one batch of due messages
+        :return: number of rows taken from the outbox
+        """
+        now = datetime.now()
+        rows = await self._claim(now)
+        if not rows:
+            return 0
+
+        errors = await self.publisher.publish_many([(ujson.loads(row.payload), row.routing_key) for row in rows])
+        sent = [row.id for row, error in zip(rows, errors) if error is None]
+        failed = [row.id for row, error in zip(rows, errors) if error is not None]
+
+        # Rows claimed again by another relay after `claim_timeout` are left to it
+        claimed = NotificationOutbox.claimed_at == now
+        async with unit_of_work() as uow:
+            if sent:
+                await uow.session.execute(
+                    sa.delete(NotificationOutbox).where(NotificationOutbox.id.in_(sent), claimed),
+                )
+            if failed:
+                logger.warning(f'Failed to publish {len(failed)} outbox messages, will retry')
+                delay = sa.func.least(
+                    self.config.retry_delay * sa.func.power(2, NotificationOutbox.attempts),
+                    self.config.max_retry_delay,
+                )
+                await uow.session.execute(
+                    sa.update(NotificationOutbox)
+                    .where(NotificationOutbox.id.in_(failed), claimed)
+                    .values(
+                        attempts=NotificationOutbox.attempts + 1,
+                        claimed_at=None,
+                        next_attempt_at=now + sa.func.make_interval(0, 0, 0, 0, 0, 0, delay),
+                    )
+                    .execution_options(synchronize_session=False),
+                )
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            NotificationOutbox.written.clear()
+            try:
+                taken = await self.drain_once()
+            except Exception as e:
+                logger.exception(f'Outbox relay failed: {e}')
+                taken = 0
+
+            if taken < self.config.batch_size:
+                try:
+                    await asyncio.wait_for(NotificationOutbox.written.wait(), self.config.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,103 @@
+import dataclasses
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+@dataclasses.dataclass
+class PoolStats:
+    size: int = 0
+    checked_in: int = 0
+    checked_out: int = 0
+    overflow: int = 0
+
+    connects: int = 0
+    checkouts: int = 0
+    checkins: int = 0
+    invalidations: int = 0
+    overflow_checkouts: int = 0
+    peak_checked_out: int = 0
+
+    waits: int = 0
+    wait_seconds_total: float = 0
+    wait_seconds_max: float = 0
+    timeouts: int = 0
+
+    def as_text(self) -> str:
+        return '\n'.join(f'{k}: {v}' for k, v in dataclasses.asdict(self).items())
+
+
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool which measures checkouts that had to wait for a connection to be returned,
+    that is every connection and every overflow slot was taken
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        exhausted = -1 < self._max_overflow <= self._overflow and self.checkedin() == 0
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            if exhausted:
+                waited = time.perf_counter() - started
+                self.waits += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+class PoolMonitor:
+    """
+    Counts pool events of the engine
+    Snapshot combines the counters with the current pool status
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.pool: QueuePool = engine.sync_engine.pool
+        self._stats = PoolStats()
+
+        event.listen(self.pool, 'connect', self._on_connect)
+        event.listen(self.pool, 'checkout', self._on_checkout)
+        event.listen(self.pool, 'checkin', self._on_checkin)
+        event.listen(self.pool, 'invalidate', self._on_invalidate)
+
+    def _on_connect(self, *_):
+        self._stats.connects += 1
+
+    def _on_checkout(self, *_):
+        self._stats.checkouts += 1
+        checked_out = self.pool.checkedout()
+        if checked_out > self.pool.size():
+            self._stats.overflow_checkouts += 1
+        self._stats.peak_checked_out = max(self._stats.peak_checked_out, checked_out)
+
+    def _on_checkin(self, *_):
+        self._stats.checkins += 1
+
+    def _on_invalidate(self, *_):
+        self._stats.invalidations += 1
+
+    def snapshot(self) -> PoolStats:
+        return dataclasses.replace(
+            self._stats,
+            size=self.pool.size(),
+            checked_in=self.pool.checkedin(),
+            checked_out=self.pool.checkedout(),
+            overflow=self.pool.overflow(),
+            waits=getattr(self.pool, 'waits', 0),
+            wait_seconds_total=round(getattr(self.pool, 'wait_seconds_total', 0), 3),
+            wait_seconds_max=round(getattr(self.pool, 'wait_seconds_max', 0), 3),
+            timeouts=getattr(self.pool, 'timeouts', 0),
+        )
@@ -0,0 +1,125 @@
+"""
+Tests run with tests/config.test.yml, never with the config.yml of a deployment
+Tests using the `postgres` fixture run against `<db.database>_test` on the server given by
+TEST_DB_HOST, TEST_DB_PORT, TEST_DB_USERNAME and TEST_DB_PASSWORD, defaults are in the config file
+The database is created from scratch by the migrations once per session and seeded with `SEED`,
+the tests are skipped if the server is not reachable
+"""
+import asyncio
+import os
+import pathlib
+from typing import Any, Awaitable, Callable
+
+import alembic.command
+import alembic.config
+import asyncpg
+import pytest
+
+os.environ['CONFIG_PATH'] = str(pathlib.Path(__file__).parent / 'config.test.yml')
+
+from utils.config import DataBaseConfig, get_config  # noqa: E402
+
+config = get_config()
+# Before database.db_core creates the engine
+config.db = DataBaseConfig.parse_obj({
+    **config.db.dict(),
+    **{
+        field: os.environ[f'TEST_DB_{field.upper()}']
+        for field in ('host', 'port', 'username', 'password')
+        if f'TEST_DB_{field.upper()}' in os.environ
+    },
+    'database': f'{config.db.database}_test',
+})
+
+SEED = """
+INSERT INTO users (id, telegram_id, username, role_id, is_deleted)
+SELECT i, 1000000 + i, 'user ' || i, CASE WHEN i <= 3 THEN 1 ELSE 2 END, i % 20 = 0
+FROM generate_series(1, 5000) i;
+
+INSERT INTO documents (id, name, is_deleted)
+SELECT i, 'document ' || i, false
+FROM generate_series(1, 50) i;
+
+-- Orders repeat every 15000 rows, only the first cycle has active ones, so they stay unique
+INSERT INTO orders (document_id, sender_id, receiver_id, status_id, created_at)
+SELECT 1 + i % 50, 1 + (i / 50) % 300, 1 + (i * 7) % 300,
+       CASE WHEN i < 15000 AND i % 10 < 4 THEN 1 + i % 3 ELSE 4 + i % 2 END,
+       now() - i * interval '1 minute'
+FROM generate_series(0, 29999) i;
+
+INSERT INTO invitations (username, role_id, token)
+SELECT 'invited ' || i, 2, md5(i::text)
+FROM generate_series(1, 2000) i;
+
+INSERT INTO cells (order_id, is_open)
+SELECT CASE WHEN i % 50 = 0 THEN NULL ELSE i END, i % 50 = 0
+FROM generate_series(1, 2000) i;
+
+SELECT setval('users_id_seq', 5000);
+SELECT setval('documents_id_seq', 50);
+ANALYZE;
+"""
+
+
+async def _connect(database: str) -> asyncpg.Connection:
+    return await asyncpg.connect(
+        host=config.db.host,
+        port=config.db.port,
+        user=config.db.username,
+        password=config.db.password.get_secret_value(),
+        database=database,
+    )
+
+
+async def _recreate_database() -> None:
+    connection = await _connect('postgres')
+    try:
+        await connection.execute(f'DROP DATABASE IF EXISTS "{config.db.database}" WITH (FORCE)')
+        await connection.execute(f'CREATE DATABASE "{config.db.database}"')
+    finally:
+        await connection.close()
+
+
+async def _seed() -> None:
+    connection = await _connect(config.db.database)
+    try:
+        await connection.execute(SEED)
+    finally:
+        await connection.close()
+
+
+def _migrate() -> None:
+    alembic_conf = alembic.config.Config('alembic.ini')
+    alembic_conf.attributes['configure_logger'] = False
+    alembic_conf.set_main_option('sqlalchemy.url', config.db.uri('postgresql'))
+    alembic.command.upgrade(alembic_conf, 'head')
+
+
+@pytest.fixture(scope='session')
+def postgres() -> None:
+    try:
+        asyncio.run(_recreate_database())
+    except (OSError, asyncpg.PostgresError) as e:
+        pytest.skip(f'Postgres is not available: {e}')
+    _migrate()
+    asyncio.run(_seed())
+
+
+@pytest.fixture
+def run_db(postgres) -> Callable[[Callable[[], Awaitable[Any]]], Any]:
+    """
+    Runs a coroutine function in a new event loop
+    Pooled connections are bound to the loop they were opened in, so the pool is emptied afterwards
+    """
+    from database.db_core import Engine
+
+    def run(coroutine_function: Callable[[], Awaitable[Any]]) -> Any:
+        async def scenario():
+            try:
+                return await coroutine_function()
+            finally:
+                await Engine.dispose()
+
+        return asyncio.run(scenario())
+
+    return run
@@ -0,0 +1,55 @@
+import asyncio
+
+import sqlalchemy as sa
+
+from database.db_core import session_scope
+from database.models import Cell
+
+# Seeded cells hold orders below this id
+FIRST_ORDER_ID = 20001
+
+
+async def free_cells() -> int:
+    async with session_scope() as session:
+        return await session.scalar(
+            sa.select(sa.func.count()).select_from(Cell).where(Cell.order_id.is_(None), Cell.is_open),
+        )
+
+
+async def claimed_cells() -> dict[int, list[int]]:
+    """Cells by the order they hold, for the orders of the test"""
+    async with session_scope() as session:
+        rows = await session.execute(sa.select(Cell.order_id, Cell.id).where(Cell.order_id >= FIRST_ORDER_ID))
+    cells: dict[int, list[int]] = {}
+    for order_id, cell_id in rows:
+        cells.setdefault(order_id, []).append(cell_id)
+    return cells
+
+
+async def release_cells() -> None:
+    async with session_scope() as session:
+        await session.execute(
+            sa.update(Cell).where(Cell.order_id >= FIRST_ORDER_ID).values(order_id=None, is_open=True),
+        )
+
+
+def test_concurrent_claims_never_share_a_cell(run_db):
+    free = run_db(free_cells)
+    claims = free + 100
+    order_ids = range(FIRST_ORDER_ID, FIRST_ORDER_ID + claims)
+
+    async def claim_all():
+        return await asyncio.gather(*(Cell.claim_free(order_id) for order_id in order_ids))
+
+    try:
+        cells = run_db(claim_all)
+        stored = run_db(claimed_cells)
+    finally:
+        run_db(release_cells)
+
+    claimed = {order_id: cell for order_id, cell in zip(order_ids, cells) if cell is not None}
+    assert len(claimed) == free
+    assert len({cell.id for cell in claimed.values()}) == free
+    assert all(cell.order_id == order_id and not cell.is_open for order_id, cell in claimed.items())
+    assert stored == {order_id: [cell.id] for order_id, cell in claimed.items()}
+
@@ -0,0 +1,15 @@
+from database.document_catalog import DocumentCatalog
+
+
+def test_catalog_hands_out_copies(run_db):
+    catalog = DocumentCatalog()
+
+    async def scenario():
+        document = await catalog.get(1)
+        document.name = 'changed by a handler'
+        return document, await catalog.get(1), await catalog.get_by_name('document 1')
+
+    changed, by_id, by_name = run_db(scenario)
+
+    assert changed is not by_id and by_id is not by_name
+    assert by_id.name == by_name.name == 'document 1'
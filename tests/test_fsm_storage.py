@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+
+from database.aiogram_storage import PostgresStorage, fsm_states
+from database.db_core import session_scope
+
+CHAT_ID = USER_ID = 777
+
+
+async def delete_states() -> None:
+    async with session_scope() as session:
+        await session.execute(sa.delete(fsm_states))
+
+
+async def in_update(storage: PostgresStorage, read: asyncio.Event, write: asyncio.Event, **data) -> None:
+    """Processes one update of the user in a task of its own, as the dispatcher does"""
+    token = storage.begin_update()
+    await storage.get_data(chat=CHAT_ID, user=USER_ID)
+    read.set()
+    await write.wait()
+    await storage.update_data(chat=CHAT_ID, user=USER_ID, data=data)
+    await storage.end_update(token)
+
+
+def test_replica_does_not_overwrite_a_newer_record(run_db):
+    replicas = [PostgresStorage(cache_size=10, replicas=2) for _ in range(2)]
+
+    async def scenario():
+        await replicas[0].set_data(chat=CHAT_ID, user=USER_ID, data={'page': 1})
+        read = [asyncio.Event(), asyncio.Event()]
+        write = [asyncio.Event(), asyncio.Event()]
+        updates = [
+            asyncio.create_task(in_update(*args, by=index))
+            for index, args in enumerate(zip(replicas, read, write))
+        ]
+        await asyncio.gather(*(event.wait() for event in read))
+        write[0].set()
+        await updates[0]
+        write[1].set()
+        with pytest.raises(RuntimeError):
+            await updates[1]
+        return await PostgresStorage(cache_size=10, replicas=2).get_data(chat=CHAT_ID, user=USER_ID)
+
+    try:
+        stored = run_db(scenario)
+    finally:
+        run_db(delete_states)
+
+    assert stored == {'page': 1, 'by': 0}
+
+
+def test_finished_state_is_written_again_after_delete(run_db):
+    storage = PostgresStorage(cache_size=10, replicas=2)
+
+    async def scenario():
+        await storage.set_state(chat=CHAT_ID, user=USER_ID, state='Order:action')
+        await storage.finish(chat=CHAT_ID, user=USER_ID)
+        await storage.set_state(chat=CHAT_ID, user=USER_ID, state='Order:status')
+        return await storage.get_state(chat=CHAT_ID, user=USER_ID)
+
+    try:
+        state = run_db(scenario)
+    finally:
+        run_db(delete_states)
+
+    assert state == 'Order:status'
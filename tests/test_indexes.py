@@ -0,0 +1,85 @@
+import contextlib
+
+import pytest
+import sqlalchemy as sa
+
+from database.db_core import Engine, session_scope
+from database.models import Cell, Invitation, Order, OrderStatus, User, UserRole
+
+ACTIVE = (OrderStatus.NEW, OrderStatus.PROCESSING, OrderStatus.READY)
+
+# Query path: the call issuing the queries and the indexes any of which the plan has to use
+QUERY_PATHS = {
+    'orders page of a sender': (
+        lambda: Order.get_page_for_view(limit=20, statuses=ACTIVE, sender_id=5, with_related=True),
+        ('ix_orders_sender_id_status_id',),
+    ),
+    'orders page of a receiver': (
+        lambda: Order.get_page_for_view(limit=20, statuses=(OrderStatus.DONE,), receiver_id=5),
+        ('ix_orders_receiver_id_status_id',),
+    ),
+    'orders of a document': (
+        lambda: Order.get_list_for_view(statuses=ACTIVE, document_id=7),
+        ('ix_orders_document_id_status_id', 'ix_orders_active_document_id'),
+    ),
+    'not completed orders of a user': (
+        lambda: Order.get_all_not_completed_order(5, with_related=True),
+        ('ix_orders_sender_id_status_id',),
+    ),
+    'active order lookup': (
+        lambda: Order.get(custom_filter=sa.and_(
+            Order.document_id == 7, Order.receiver_id == 9, Order.sender_id == 5, Order.active_filter(),
+        )),
+        ('ix_orders_active_document_id',),
+    ),
+    'invitation by token': (
+        lambda: Invitation.get_by_token('abc'),
+        ('ix_invitations_token',),
+    ),
+    'free cell': (
+        lambda: Cell.get(order_id=None, is_open=True),
+        ('ix_cells_free',),
+    ),
+    'cell of an order': (
+        lambda: Cell.get_id_by_order(77),
+        ('ix_cells_order_id',),
+    ),
+    'accountants': (
+        lambda: User.get_list(role_id=UserRole.ACCOUNTANT, is_deleted=False),
+        ('ix_users_active_role_id',),
+    ),
+}
+
+
+@contextlib.contextmanager
+def captured_statements():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    sa.event.listen(Engine.sync_engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        sa.event.remove(Engine.sync_engine, 'before_cursor_execute', capture)
+
+
+async def explain(query_path) -> list[str]:
+    with captured_statements() as statements:
+        await query_path()
+    plans = []
+    async with session_scope() as session:
+        connection = await session.connection()
+        for statement, parameters in statements:
+            plan = await connection.exec_driver_sql(f'EXPLAIN {statement}', parameters)
+            plans.append('\n'.join(plan.scalars()))
+    return plans
+
+
+@pytest.mark.parametrize('name', QUERY_PATHS)
+def test_query_path_uses_index(name, run_db):
+    query_path, indexes = QUERY_PATHS[name]
+    plans = run_db(lambda: explain(query_path))
+    assert plans
+    assert any(index in plan for plan in plans for index in indexes), plans
@@ -0,0 +1,233 @@
+import asyncio
+
+import ujson
+from aiogram.utils.exceptions import BadRequest, BotBlocked, NetworkError, RetryAfter, Unauthorized
+
+from bot.notifier import NotificationService
+from utils.config import NotifierConfig
+
+CONFIG = NotifierConfig(coalesce_window=0.01, global_rate=1000, chat_rate=1000, workers=2, send_attempts=2)
+
+
+class FakeBot:
+    """
+    Bot API double: records sent messages, `failures` maps a call number to the exception it raises,
+    texts containing one of `fail_texts` fail for now and the ones containing `refused_texts` are refused by Telegram
+    """
+
+    def __init__(
+            self,
+            failures: dict[int, Exception] | None = None,
+            fail_texts: set[str] = frozenset(),
+            refused_texts: set[str] = frozenset(),
+    ):
+        self.failures = failures or {}
+        self.fail_texts = fail_texts
+        self.refused_texts = refused_texts
+        self.calls = 0
+        self.sent: list[tuple[int, str]] = []
+
+    async def send_message(self, chat_id: int, text: str) -> None:
+        self.calls += 1
+        if self.calls in self.failures:
+            raise self.failures[self.calls]
+        if any(fail_text in text for fail_text in self.fail_texts):
+            raise RuntimeError('Bot API is down')
+        if any(refused_text in text for refused_text in self.refused_texts):
+            raise BadRequest("Bad Request: can't parse entities")
+        self.sent.append((chat_id, text))
+
+
+class FakeMessage:
+    """Incoming broker message double, remembers how it was settled"""
+
+    def __init__(self, body: bytes, broken_channel: bool = False):
+        self.body = body
+        self.broken_channel = broken_channel
+        self.outcome: str | None = None
+
+    def _settle(self, outcome: str) -> None:
+        if self.broken_channel:
+            raise ConnectionError('Channel is closed')
+        self.outcome = outcome
+
+    async def ack(self) -> None:
+        self._settle('ack')
+
+    async def nack(self, requeue: bool = True) -> None:
+        self._settle('requeue' if requeue else 'nack')
+
+    async def reject(self) -> None:
+        self._settle('reject')
+
+
+class FakeBroker:
+    """Pushes messages into the service the way the `push` queue consumer does"""
+
+    def __init__(self, service: NotificationService):
+        self.service = service
+        self.messages: list[FakeMessage] = []
+
+    async def publish(self, telegram_user_id: int, text: str, **kwargs) -> FakeMessage:
+        message = FakeMessage(ujson.dumps(dict(telegram_user_id=telegram_user_id, message=text)).encode(), **kwargs)
+        self.messages.append(message)
+        await self.service.on_rmq_message(message)
+        return message
+
+    async def settled(self, timeout: float = 2) -> None:
+        async def wait():
+            while any(message.outcome is None and not message.broken_channel for message in self.messages):
+                await asyncio.sleep(0.005)
+        await asyncio.wait_for(wait(), timeout)
+
+
+def run(scenario):
+    async def main():
+        bot = scenario.bot
+        service = NotificationService(send=bot.send_message, config=CONFIG)
+        broker = FakeBroker(service)
+        service.start()
+        try:
+            await scenario(broker)
+            await broker.settled()
+        finally:
+            await service.stop()
+        return broker
+    return asyncio.run(main())
+
+
+def scenario_with(bot: FakeBot):
+    def decorator(func):
+        func.bot = bot
+        return func
+    return decorator
+
+
+def test_messages_of_one_user_are_coalesced():
+    bot = FakeBot()
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        for i in range(3):
+            await broker.publish(1, f'msg{i}')
+        await broker.publish(2, 'other')
+
+    broker = run(scenario)
+    assert sorted(bot.sent) == [(1, 'msg0\n\nmsg1\n\nmsg2'), (2, 'other')]
+    assert [message.outcome for message in broker.messages] == ['ack'] * 4
+
+
+def test_only_unsent_chunks_are_delivered_again():
+    bot = FakeBot(fail_texts={'second'})
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        await broker.publish(1, 'first ' + 'x' * 3000)
+        await broker.publish(1, 'second ' + 'y' * 3000)
+
+    broker = run(scenario)
+    assert len(bot.sent) == 1 and bot.sent[0][1].startswith('first')
+    assert [message.outcome for message in broker.messages] == ['ack', 'requeue']
+
+
+def test_refused_message_is_rejected_and_the_rest_delivered():
+    bot = FakeBot(refused_texts={'broken'})
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        for text in ('first', 'broken', 'third'):
+            await broker.publish(1, text)
+        await broker.publish(1, 'after ' + 'x' * 5000)
+
+    broker = run(scenario)
+    assert [text[:5] for _, text in bot.sent] == ['first', 'third', 'after', 'xxxxx']
+    assert [message.outcome for message in broker.messages] == ['ack', 'reject', 'ack', 'ack']
+
+
+def test_network_error_is_delivered_again():
+    bot = FakeBot(failures={1: NetworkError('Aiohttp client throws an error: ServerDisconnectedError')})
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        await broker.publish(1, 'hello')
+
+    broker = run(scenario)
+    assert bot.sent == []
+    assert broker.messages[0].outcome == 'requeue'
+
+
+def test_long_message_is_acked_after_its_last_part():
+    bot = FakeBot()
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        await broker.publish(1, 'z' * 9000)
+
+    broker = run(scenario)
+    assert [len(text) for _, text in bot.sent] == [4096, 4096, 808]
+    assert broker.messages[0].outcome == 'ack'
+
+
+def test_flood_control_is_retried():
+    bot = FakeBot(failures={1: RetryAfter(0)})
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        await broker.publish(1, 'hello')
+
+    broker = run(scenario)
+    assert bot.sent == [(1, 'hello')]
+    assert broker.messages[0].outcome == 'ack'
+
+
+def test_blocked_user_is_acked_without_delivery():
+    bot = FakeBot(failures={1: BotBlocked('Forbidden: bot was blocked by the user')})
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        await broker.publish(1, 'hello')
+
+    broker = run(scenario)
+    assert bot.sent == []
+    assert broker.messages[0].outcome == 'ack'
+
+
+def test_any_unauthorized_user_is_acked_without_delivery():
+    bot = FakeBot(failures={1: Unauthorized('Forbidden: bot was kicked from the supergroup chat')})
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        await broker.publish(1, 'hello')
+
+    broker = run(scenario)
+    assert bot.sent == []
+    assert broker.messages[0].outcome == 'ack'
+
+
+def test_failed_ack_does_not_stop_workers():
+    bot = FakeBot()
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        for telegram_user_id in range(CONFIG.workers):
+            await broker.publish(telegram_user_id, 'lost ack', broken_channel=True)
+        await asyncio.sleep(0.1)
+        await broker.publish(100, 'after reconnect')
+
+    broker = run(scenario)
+    assert (100, 'after reconnect') in bot.sent
+    assert broker.messages[-1].outcome == 'ack'
+
+
+def test_malformed_message_is_rejected():
+    bot = FakeBot()
+
+    @scenario_with(bot)
+    async def scenario(broker: FakeBroker):
+        message = FakeMessage(b'not json')
+        broker.messages.append(message)
+        await broker.service.on_rmq_message(message)
+
+    broker = run(scenario)
+    assert broker.messages[0].outcome == 'reject'
+    assert bot.sent == []
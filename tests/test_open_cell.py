@@ -0,0 +1,112 @@
+import pytest
+import sqlalchemy as sa
+
+from bot.sdk import common
+from database.db_core import Session, unit_of_work
+from database.models import Cell
+from utils.cell_client import CellOpenResult
+
+ORDER_ID = 25001
+
+
+class FakeCellClient:
+    """Cell controller double: answers with `replies` in turn and records the committed owner of each asked cell"""
+
+    def __init__(self, *replies: CellOpenResult | Exception):
+        self.replies = list(replies)
+        self.asked: list[tuple[int, int | None]] = []
+
+    async def open_cell(self, cell_id: int, is_sending: bool) -> CellOpenResult:
+        self.asked.append((cell_id, await committed_state(cell_id)))
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+async def committed_state(cell_id: int) -> tuple[int | None, bool]:
+    # A session of its own sees only committed rows
+    async with Session() as session:
+        return (await session.execute(sa.select(Cell.order_id, Cell.is_open).where(Cell.id == cell_id))).one()
+
+
+def open_in_unit_of_work(run_db, monkeypatch, client: FakeCellClient):
+    monkeypatch.setattr(common, 'get_cell_client', lambda: client)
+
+    async def scenario():
+        async with unit_of_work():
+            return await common.open_free_cell(ORDER_ID)
+
+    return run_db(scenario)
+
+
+def states(run_db, cell_ids: list[int]) -> list[tuple[int | None, bool]]:
+    async def read():
+        return [await committed_state(cell_id) for cell_id in cell_ids]
+
+    return run_db(read)
+
+
+def restore(run_db, cell_ids: list[int]) -> None:
+    async def free():
+        async with Session() as session:
+            async with session.begin():
+                await session.execute(sa.update(Cell).where(Cell.id.in_(cell_ids)).values(order_id=None, is_open=True))
+
+    run_db(free)
+
+
+def test_claim_and_release_are_committed_around_the_controller_call(run_db, monkeypatch):
+    client = FakeCellClient(CellOpenResult.REFUSED, CellOpenResult.OPENED)
+    try:
+        cell, result = open_in_unit_of_work(run_db, monkeypatch, client)
+        (broken_id, _), (opened_id, _) = client.asked
+        assert states(run_db, [broken_id, opened_id]) == [(None, False), (ORDER_ID, False)]
+    finally:
+        restore(run_db, [cell_id for cell_id, _ in client.asked])
+
+    assert [state for _, state in client.asked] == [(ORDER_ID, False), (ORDER_ID, False)]
+    assert (cell.id, result) == (opened_id, CellOpenResult.OPENED)
+
+
+def test_unanswered_cell_stays_in_service(run_db, monkeypatch):
+    client = FakeCellClient(CellOpenResult.NO_REPLY)
+    try:
+        cell, result = open_in_unit_of_work(run_db, monkeypatch, client)
+        [(cell_id, _)] = client.asked
+        assert states(run_db, [cell_id]) == [(None, True)]
+    finally:
+        restore(run_db, [cell_id for cell_id, _ in client.asked])
+
+    assert (cell, result) == (None, CellOpenResult.NO_REPLY)
+
+
+def test_refused_cell_is_returned_to_service(run_db, monkeypatch):
+    client = FakeCellClient(CellOpenResult.REFUSED, CellOpenResult.NO_REPLY)
+    try:
+        open_in_unit_of_work(run_db, monkeypatch, client)
+        broken_id = client.asked[0][0]
+
+        async def repair():
+            out_of_service = [cell.id for cell in await Cell.get_out_of_service()]
+            return out_of_service, await Cell.return_to_service(broken_id), await Cell.return_to_service(broken_id)
+
+        out_of_service, repaired, repaired_again = run_db(repair)
+        assert states(run_db, [broken_id]) == [(None, True)]
+    finally:
+        restore(run_db, [cell_id for cell_id, _ in client.asked])
+
+    assert broken_id in out_of_service
+    assert repaired.id == broken_id and repaired.is_open
+    assert repaired_again is None
+
+
+def test_cell_is_released_when_the_controller_is_unreachable(run_db, monkeypatch):
+    client = FakeCellClient(ConnectionError('broker is down'))
+    try:
+        with pytest.raises(ConnectionError):
+            open_in_unit_of_work(run_db, monkeypatch, client)
+        [(cell_id, _)] = client.asked
+        assert states(run_db, [cell_id]) == [(None, True)]
+    finally:
+        restore(run_db, [cell_id for cell_id, _ in client.asked])
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from database.db_core import Engine, session_scope
+from database.models import NotificationOutbox, Order, OrderStatus
+
+# Users without seeded orders
+SENDER_ID = 4001
+RECEIVER_IDS = (4002, 4003, 4004)
+DOCUMENT_ID = 1
+REQUESTS_PER_ORDER = 50
+
+
+async def active_orders() -> list[tuple[int, int]]:
+    async with session_scope() as session:
+        rows = await session.execute(
+            sa.select(Order.id, Order.receiver_id).where(Order.sender_id == SENDER_ID, Order.active_filter()),
+        )
+        return rows.all()
+
+
+async def delete_orders() -> None:
+    async with session_scope() as session:
+        await session.execute(sa.delete(NotificationOutbox))
+        await session.execute(sa.delete(Order).where(Order.sender_id == SENDER_ID))
+
+
+def test_duplicate_requests_create_one_order(run_db):
+    requests = [receiver_id for receiver_id in RECEIVER_IDS for _ in range(REQUESTS_PER_ORDER)]
+
+    async def request_all():
+        return await asyncio.gather(*(
+            Order.create_or_get_active(sender_id=SENDER_ID, receiver_id=receiver_id, document_id=DOCUMENT_ID)
+            for receiver_id in requests
+        ))
+
+    try:
+        results = run_db(request_all)
+        stored = run_db(active_orders)
+    finally:
+        run_db(delete_orders)
+
+    assert sorted(receiver_id for _, receiver_id in stored) == sorted(RECEIVER_IDS)
+    order_ids = {receiver_id: order_id for order_id, receiver_id in stored}
+    for receiver_id, (order, created) in zip(requests, results):
+        assert order.id == order_ids[receiver_id]
+        assert order.status_id == OrderStatus.NEW
+    assert sum(created for _, created in results) == len(RECEIVER_IDS)
+
+
+def test_completed_order_does_not_block_a_new_one(run_db):
+    async def scenario():
+        first, _ = await Order.create_or_get_active(SENDER_ID, RECEIVER_IDS[0], DOCUMENT_ID)
+        await Order.change_status(first.id, OrderStatus.NEW, OrderStatus.DECLINED)
+        second, created = await Order.create_or_get_active(SENDER_ID, RECEIVER_IDS[0], DOCUMENT_ID)
+        return first, second, created
+
+    try:
+        first, second, created = run_db(scenario)
+    finally:
+        run_db(delete_orders)
+
+    assert created and second.id != first.id
+
+
+def test_order_committed_while_inserting_is_returned(run_db):
+    """The insert waits for a concurrent one and conflicts with a row its snapshot does not see"""
+    async def scenario():
+        async with Engine.connect() as connection:
+            transaction = await connection.begin()
+            await connection.execute(sa.insert(Order).values(
+                document_id=DOCUMENT_ID,
+                sender_id=SENDER_ID,
+                receiver_id=RECEIVER_IDS[0],
+                status_id=OrderStatus.NEW,
+                created_at=datetime.now(),
+            ))
+            request = asyncio.create_task(Order.create_or_get_active(SENDER_ID, RECEIVER_IDS[0], DOCUMENT_ID))
+            await asyncio.sleep(0.5)
+            assert not request.done()
+            await transaction.commit()
+        return await request
+
+    try:
+        order, created = run_db(scenario)
+        stored = run_db(active_orders)
+    finally:
+        run_db(delete_orders)
+
+    assert not created
+    assert stored == [(order.id, RECEIVER_IDS[0])]
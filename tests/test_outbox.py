@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+
+from database.db_core import Session, session_scope
+from database.models import NotificationOutbox
+from database.outbox import OutboxRelay
+from utils.config import OutboxConfig
+
+CONFIG = OutboxConfig(batch_size=10, claim_timeout=60)
+
+
+class FakePublisher:
+    """Publishes every message except the ones for `failing` users, runs `during_publish` first"""
+
+    def __init__(self, failing: set[int] = frozenset(), during_publish=None):
+        self.failing = failing
+        self.during_publish = during_publish
+        self.published: list[dict] = []
+
+    async def publish_many(self, messages: list[tuple[dict, str]]) -> list[Exception | None]:
+        if self.during_publish is not None:
+            await self.during_publish()
+        errors = []
+        for body, _ in messages:
+            if body['telegram_user_id'] in self.failing:
+                errors.append(ConnectionError('broker is down'))
+            else:
+                self.published.append(body)
+                errors.append(None)
+        return errors
+
+
+async def outbox_rows() -> list[tuple[str, int, bool]]:
+    async with session_scope() as session:
+        rows = await session.execute(
+            sa.select(NotificationOutbox.payload, NotificationOutbox.attempts, NotificationOutbox.claimed_at)
+            .order_by(NotificationOutbox.id),
+        )
+        return [(payload, attempts, claimed_at is not None) for payload, attempts, claimed_at in rows]
+
+
+async def clear_outbox() -> None:
+    async with session_scope() as session:
+        await session.execute(sa.delete(NotificationOutbox))
+
+
+def test_batch_is_claimed_and_committed_before_publishing(run_db):
+    async def during_publish():
+        # Rows are neither locked nor due for other relays while the batch is published
+        async with Session() as session:
+            async with session.begin():
+                locked = await session.execute(
+                    sa.select(NotificationOutbox.id).with_for_update(nowait=True),
+                )
+                assert len(locked.all()) == 3
+        assert await OutboxRelay(FakePublisher(), CONFIG).drain_once() == 0
+
+    publisher = FakePublisher(failing={2}, during_publish=during_publish)
+
+    async def scenario():
+        await NotificationOutbox.push_many([(f'message {i}', i) for i in range(1, 4)])
+        taken = await OutboxRelay(publisher, CONFIG).drain_once()
+        return taken, await outbox_rows()
+
+    try:
+        taken, rows = run_db(scenario)
+    finally:
+        run_db(clear_outbox)
+
+    assert taken == 3
+    assert [body['telegram_user_id'] for body in publisher.published] == [1, 3]
+    [(payload, attempts, claimed)] = rows
+    assert '"telegram_user_id":2' in payload and attempts == 1 and not claimed
+
+
+def test_rows_of_a_dead_relay_are_claimed_again(run_db):
+    publisher = FakePublisher()
+
+    async def scenario():
+        await NotificationOutbox.push_many([('lost', 1)])
+        async with session_scope() as session:
+            expired = datetime.now() - timedelta(seconds=1)
+            await session.execute(
+                sa.update(NotificationOutbox).values(claimed_at=expired - timedelta(seconds=60), next_attempt_at=expired),
+            )
+        return await OutboxRelay(publisher, CONFIG).drain_once(), await outbox_rows()
+
+    try:
+        taken, rows = run_db(scenario)
+    finally:
+        run_db(clear_outbox)
+
+    assert taken == 1 and rows == []
+    assert publisher.published == [dict(message='lost', telegram_user_id=1)]
@@ -0,0 +1,28 @@
+import pytest
+
+from bot.sdk.common import page_callback, parse_page_turn
+
+
+def callback_data(**fields) -> dict:
+    fields = dict(dict(view='ord', filter='ar', direction='next', key='40'), **fields)
+    return page_callback.parse(page_callback.new(**fields))
+
+
+def test_page_turn_is_parsed():
+    assert parse_page_turn(callback_data()) == ('ord', 'ar', dict(after=40))
+    assert parse_page_turn(callback_data(view='doc', filter='', direction='prev')) == ('doc', '', dict(before=40))
+
+
+@pytest.mark.parametrize('fields', [
+    dict(view='usr'),
+    dict(filter='xr'),
+    dict(filter='a'),
+    dict(view='doc'),
+    dict(direction='up'),
+    dict(key='-1'),
+    dict(key='1.5'),
+    dict(key='²'),
+    dict(key='99999999999'),
+])
+def test_forged_page_turn_is_refused(fields):
+    assert parse_page_turn(callback_data(**fields)) is None
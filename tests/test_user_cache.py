@@ -0,0 +1,45 @@
+import asyncio
+
+from database import models
+from database.change_listener import ChangeListener
+from database.db_core import outside_unit_of_work, unit_of_work
+from database.models import User
+from utils.cache import TTLCache
+
+# Seeded user, see conftest
+USER_ID = 4001
+TELEGRAM_ID = 1000000 + USER_ID
+
+
+def test_cached_user_is_refreshed_after_commit(run_db, monkeypatch):
+    monkeypatch.setattr(models, '_users_by_telegram_id', TTLCache(ttl=3600))
+
+    async def read_elsewhere() -> str:
+        async with outside_unit_of_work():
+            return (await User.get_by_telegram_id(TELEGRAM_ID)).username
+
+    async def scenario():
+        user = await User.get(id=USER_ID)
+        async with unit_of_work():
+            await user.update(username='renamed')
+            # Another handler reads the committed row meanwhile and caches it
+            before_commit = await asyncio.create_task(read_elsewhere())
+        after_commit = (await User.get_by_telegram_id(TELEGRAM_ID)).username
+        await user.update(username=f'user {USER_ID}')
+        return before_commit, after_commit
+
+    assert run_db(scenario) == (f'user {USER_ID}', 'renamed')
+
+
+def test_change_of_another_process_refreshes_cached_user(run_db, monkeypatch):
+    monkeypatch.setattr(models, '_users_by_telegram_id', TTLCache(ttl=3600))
+
+    async def scenario():
+        first = await User.get_by_telegram_id(TELEGRAM_ID)
+        cached = await User.get_by_telegram_id(TELEGRAM_ID)
+        ChangeListener._on_notification(None, None, None, User.__tablename__)
+        return first, cached, await User.get_by_telegram_id(TELEGRAM_ID)
+
+    first, cached, reread = run_db(scenario)
+    assert cached is first
+    assert reread is not first and reread.id == USER_ID
@@ -0,0 +1,138 @@
+import asyncio
+import bisect
+import enum
+import time
+import uuid
+
+import ujson
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage, AbstractQueue
+from loguru import logger
+
+from utils.config import CellControllerConfig, get_config
+from utils.rabbit import CELL_REQUEST_ROUTING_KEY, RabbitPublisher, get_publisher
+
+
+class LatencyHistogram:
+    """Counts observations into fixed buckets, the last bucket has no upper bound"""
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def as_text(self) -> str:
+        labels = [f'<={bound}s' for bound in self.bounds] + [f'>{self.bounds[-1]}s']
+        buckets = ' '.join(f'{label}:{count}' for label, count in zip(labels, self.counts) if count)
+        return f'n={self.count} avg={self.total / self.count:.3f}s {buckets}'
+
+
+class CellOpenResult(enum.Enum):
+    OPENED = 'opened'
+    # The controller reported that the cell failed to open
+    REFUSED = 'refused'
+    # No attempt was answered, nothing is known about the cell
+    NO_REPLY = 'no_reply'
+
+
+class CellControllerClient:
+    """
+    Request/reply client of the cell controller
+    Every open request carries a correlation id and the name of an exclusive reply queue,
+    the caller waits for the controller's answer and retries requests left unanswered
+    """
+
+    def __init__(self, publisher: RabbitPublisher, config: CellControllerConfig):
+        self.publisher = publisher
+        self.config = config
+        self.latency: dict[int, LatencyHistogram] = {}
+        self._pending: dict[str, asyncio.Future] = {}
+        self._channel: AbstractChannel | None = None
+        self._reply_queue: AbstractQueue | None = None
+
+    async def start(self) -> None:
+        self._channel = await self.publisher.connection.channel()
+        self._reply_queue = await self._channel.declare_queue(exclusive=True, auto_delete=True)
+        await self._reply_queue.consume(self._on_reply, no_ack=True)
+
+    async def stop(self) -> None:
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        if self._channel is not None:
+            await self._channel.close()
+
+    async def _on_reply(self, message: AbstractIncomingMessage) -> None:
+        future = self._pending.pop(message.correlation_id, None)
+        if future is None or future.done():
+            # The request has already timed out
+            return
+        future.set_result(ujson.loads(message.body))
+
+    async def open_cell(self, cell_id: int, is_sending: bool) -> CellOpenResult:
+        """
+        :param cell_id: cell to open
+        :param is_sending: the document is being put into the cell
+        :return: OPENED once the controller confirmed the cell is open,
+            REFUSED if it reported a failure, NO_REPLY if it did not answer any attempt
+        """
+        for attempt in range(1, self.config.attempts + 1):
+            correlation_id = uuid.uuid4().hex
+            future = asyncio.get_running_loop().create_future()
+            self._pending[correlation_id] = future
+            started_at = time.monotonic()
+            try:
+                await self.publisher.publish(
+                    dict(
+                        message='',
+                        telegram_user_id=1,
+                        cell_id=cell_id,
+                        is_sending=is_sending,
+                    ),
+                    routing_key=CELL_REQUEST_ROUTING_KEY,
+                    reply_to=self._reply_queue.name,
+                    correlation_id=correlation_id,
+                    # An unanswered request must not open the cell after it was retried
+                    expiration=self.config.ack_timeout,
+                )
+                reply = await asyncio.wait_for(future, self.config.ack_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f'Cell {cell_id} did not answer, attempt {attempt}/{self.config.attempts}')
+                continue
+            finally:
+                self._pending.pop(correlation_id, None)
+
+            self._observe(cell_id, time.monotonic() - started_at)
+            if reply.get('ok'):
+                return CellOpenResult.OPENED
+            logger.warning(f'Cell {cell_id} failed to open: {reply.get("error")}')
+            return CellOpenResult.REFUSED
+        return CellOpenResult.NO_REPLY
+
+    def _observe(self, cell_id: int, latency: float) -> None:
+        histogram = self.latency.get(cell_id)
+        if histogram is None:
+            histogram = self.latency[cell_id] = LatencyHistogram(self.config.latency_buckets)
+        histogram.observe(latency)
+
+    def latency_report(self) -> str:
+        if not self.latency:
+            return 'Нет данных'
+        return '\n'.join(
+            f'Ячейка {cell_id}: {histogram.as_text()}'
+            for cell_id, histogram in sorted(self.latency.items())
+        )
+
+
+cell_client = CellControllerClient(get_publisher(), get_config().cell_controller)
+
+
+def get_cell_client() -> CellControllerClient:
+    return cell_client
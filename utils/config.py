@@ -1,5 +1,7 @@
 import functools
+import os
 import pathlib
+from typing import Literal
 
 import yaml
 from pydantic import BaseModel, SecretStr
@@ -12,6 +14,29 @@ class DataBaseConfig(BaseModel):
     port: int
     database: str
 
+    pool_size: int = 5
+    pool_max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = -1
+    pool_pre_ping: bool = False
+    statement_cache_size: int = 100
+
+    leak_detection: bool = False
+    leak_threshold: float = 30
+    leak_check_interval: float = 10
+
+    notify_changes: bool = False
+
+    def engine_options(self) -> dict:
+        return dict(
+            pool_size=self.pool_size,
+            max_overflow=self.pool_max_overflow,
+            pool_timeout=self.pool_timeout,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=self.pool_pre_ping,
+            connect_args=dict(prepared_statement_cache_size=self.statement_cache_size),
+        )
+
     def uri(self, protocol: str = 'postgresql+asyncpg') -> str:
         return "{protocol}://{user}:{pwd}@{host}:{port}/{db}".format(
             protocol=protocol,
@@ -29,6 +54,11 @@ class RabbitMQConfig(BaseModel):
     password: SecretStr
     vhost: str
 
+    channel_pool_size: int = 4
+    publisher_confirms: bool = True
+    max_inflight: int = 256
+    publish_timeout: float = 10
+
 
 class TelegramConfig(BaseModel):
     tg_token: str
@@ -37,12 +67,74 @@ class TelegramConfig(BaseModel):
     webhook: str
 
 
+class WebhookConfig(BaseModel):
+    workers: int = 16
+    queue_size: int = 100
+    drain_timeout: float = 10
+    wait_buckets: tuple[float, ...] = (0.01, 0.05, 0.1, 0.5, 1, 5)
+
+    dedup_size: int = 10000
+    dedup_shared: bool = False
+    dedup_window: float = 3600
+    dedup_prune_interval: float = 300
+
+
+class CacheConfig(BaseModel):
+    # Cached users are dropped as soon as the users table changes, the same way as rendered pages
+    user_ttl: float = 0
+    user_max_size: int = 1024
+    # Rendered pages are dropped as soon as a table they show changes,
+    # with several bot processes enable `db.notify_changes` so they see each other's writes
+    render_ttl: float = 300
+    render_max_size: int = 512
+
+
+class OutboxConfig(BaseModel):
+    batch_size: int = 100
+    poll_interval: float = 1
+    retry_delay: float = 5
+    max_retry_delay: float = 300
+    # Rows claimed by a relay are published by others only after this, it must outlast publishing a batch
+    claim_timeout: float = 60
+
+
+class NotifierConfig(BaseModel):
+    prefetch: int = 200
+    coalesce_window: float = 1
+    early_flush_size: int = 20
+    global_rate: float = 30
+    chat_rate: float = 1
+    workers: int = 16
+    send_attempts: int = 3
+
+
+class FsmStorageConfig(BaseModel):
+    # 'memory' loses the states on restart and can not be shared by several replicas
+    backend: Literal['memory', 'postgres'] = 'postgres'
+    cache_size: int = 10000
+    # Number of bot replicas sharing the table, cached states are trusted only with one
+    replicas: int = 1
+
+
+class CellControllerConfig(BaseModel):
+    ack_timeout: float = 5
+    attempts: int = 2
+    failover_cells: int = 2
+    latency_buckets: tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
 class AppConfig(BaseModel):
     migrate_to: str
 
     telegram: TelegramConfig
     db: DataBaseConfig
     rmq: RabbitMQConfig
+    webhook: WebhookConfig = WebhookConfig()
+    cache: CacheConfig = CacheConfig()
+    fsm: FsmStorageConfig = FsmStorageConfig()
+    outbox: OutboxConfig = OutboxConfig()
+    notifier: NotifierConfig = NotifierConfig()
+    cell_controller: CellControllerConfig = CellControllerConfig()
 
     project_dir: pathlib.Path
     static_dir: pathlib.Path
@@ -50,7 +142,10 @@ class AppConfig(BaseModel):
 
 @functools.lru_cache
 def get_config() -> AppConfig:
-    path_to_config = pathlib.Path(__file__).parent.parent.resolve() / 'config.yml'
+    """Reads config.yml of the project, or the file `CONFIG_PATH` points to, see config.example.yml"""
+    path_to_config = pathlib.Path(
+        os.environ.get('CONFIG_PATH') or pathlib.Path(__file__).parent.parent.resolve() / 'config.yml'
+    )
     assert path_to_config.exists(), 'No Config file!'
 
     project_dir = pathlib.Path(__file__).parent.parent.resolve()
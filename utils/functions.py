@@ -3,6 +3,8 @@ from typing import TypeVar
 
 _T = TypeVar('_T')
 
+TELEGRAM_MESSAGE_LIMIT = 4096
+
 
 def get_all_enum_values(
         enum: EnumMeta,
@@ -23,3 +25,17 @@ def get_all_enum_values(
             new_accepted.append(key)
 
     return new_accepted
+
+
+def split_text(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """Splits text into chunks of at most `limit` chars, preferably on line breaks"""
+    chunks: list[str] = []
+    while len(text) > limit:
+        cut = text.rfind('\n', 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip('\n')
+    if text:
+        chunks.append(text)
+    return chunks
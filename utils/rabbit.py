@@ -1,42 +1,84 @@
+import asyncio
+from typing import Any
+
 import aio_pika
 import ujson
+from aio_pika.abc import AbstractRobustChannel, AbstractRobustConnection
+from aio_pika.pool import Pool
+
+from utils.config import RabbitMQConfig, get_config
+
+
+class RabbitPublisher:
+    """
+    Owns a robust connection and a small pool of channels for publishing
+    Limits the number of unconfirmed messages, so a slow broker makes
+    publishers wait instead of piling up messages in memory
+    """
+
+    def __init__(self, config: RabbitMQConfig):
+        self.config = config
+        self.connection: AbstractRobustConnection | None = None
+        self._channels: Pool[AbstractRobustChannel] | None = None
+        self._inflight = asyncio.Semaphore(config.max_inflight)
+
+    async def connect(self) -> None:
+        self.connection = await aio_pika.connect_robust(
+            host=self.config.host,
+            virtualhost=self.config.vhost,
+            login=self.config.username,
+            password=self.config.password.get_secret_value(),
+        )
+        self._channels = Pool(self._open_channel, max_size=self.config.channel_pool_size)
+
+    async def _open_channel(self) -> AbstractRobustChannel:
+        return await self.connection.channel(publisher_confirms=self.config.publisher_confirms)
+
+    async def close(self) -> None:
+        if self._channels is not None:
+            await self._channels.close()
+        if self.connection is not None:
+            await self.connection.close()
+
+    async def publish(self, body: dict[str, Any], routing_key: str, **properties) -> None:
+        """
+        With publisher confirms returns after the broker acknowledged the message
+        :param properties: extra message properties, like reply_to or correlation_id
+        """
+        async with self._inflight:
+            async with self._channels.acquire() as channel:
+                await channel.default_exchange.publish(
+                    aio_pika.Message(
+                        body=ujson.dumps(body).encode(),
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        **properties,
+                    ),
+                    routing_key=routing_key,
+                    timeout=self.config.publish_timeout,
+                )
+
+    async def publish_many(self, messages: list[tuple[dict[str, Any], str]]) -> list[Exception | None]:
+        """
+        Publishes all messages concurrently and waits for all confirmations at once
+        :param messages: (body, routing_key) pairs
+        :return: the error of every message which was not published, None for published ones
+        """
+        results = await asyncio.gather(
+            *(self.publish(body, routing_key) for body, routing_key in messages),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        return [result if isinstance(result, Exception) else None for result in results]
+
+
+PUSH_ROUTING_KEY = 'push'
+CELL_REQUEST_ROUTING_KEY = 'cell_reqeust'
+
+publisher = RabbitPublisher(get_config().rmq)
+
 
+def get_publisher() -> RabbitPublisher:
+    return publisher
 
-async def queue_push(
-        channel: aio_pika.Channel,
-        message: str,
-        telegram_user_id: int,
-):
-    await channel.default_exchange.publish(
-        aio_pika.Message(
-            body=ujson.dumps(
-                dict(
-                    message=message,
-                    telegram_user_id=telegram_user_id,
-                ),
-            ).encode(),
-            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-        ),
-        routing_key='push',
-    )
-
-
-async def queue_cell_open(
-        channel: aio_pika.Channel,
-        cell_id: int,
-        is_sending: bool,
-):
-    await channel.default_exchange.publish(
-        aio_pika.Message(
-            body=ujson.dumps(
-                dict(
-                    message='',
-                    telegram_user_id=1,
-                    cell_id=cell_id,
-                    is_sending=is_sending,
-                ),
-            ).encode(),
-            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
-        ),
-        routing_key='cell_reqeust',
-    )